@@ -0,0 +1,72 @@
+from collections import deque
+
+
+class _Partition:
+    __slots__ = ("pending", "done", "end", "committed")
+
+    def __init__(self):
+        self.pending = deque()  # offsets in poll order
+        self.done = set()
+        self.end = None  # consumer position after the last poll
+        self.committed = None
+
+
+class OffsetTracker:
+    """Tracks which polled jobs have finished, per partition.
+
+    Jobs finish out of order when probes run concurrently, so the offset that
+    is safe to commit for a partition is the first job still outstanding (or
+    the poll position once nothing is): committing past it could lose that
+    job in a crash. Everything before it has finished, so a restart replays
+    at most the jobs that were in flight.
+    """
+
+    def __init__(self):
+        self._partitions = {}
+        self._jobs = {}  # id(job) -> (tp, offset); jobs stay referenced until done()
+
+    def track(self, tp, records, end):
+        """Register the records just polled from tp; end is the consumer's position after them."""
+        partition = self._partitions.get(tp)
+        if partition is None:
+            partition = self._partitions[tp] = _Partition()
+        for msg in records:
+            partition.pending.append(msg.offset)
+            self._jobs[id(msg.value)] = (tp, msg.offset)
+        partition.end = end
+
+    def done(self, job):
+        tp, offset = self._jobs.pop(id(job), (None, None))
+        partition = self._partitions.get(tp)
+        if partition is None:
+            return
+        partition.done.add(offset)
+        pending = partition.pending
+        while pending and pending[0] in partition.done:
+            partition.done.discard(pending.popleft())
+
+    @property
+    def in_flight(self):
+        return len(self._jobs)
+
+    def committable(self) -> dict:
+        """{tp: offset} for partitions that moved since the last mark_committed()."""
+        offsets = {}
+        for tp, partition in self._partitions.items():
+            offset = partition.pending[0] if partition.pending else partition.end
+            if offset is not None and offset != partition.committed:
+                offsets[tp] = offset
+        return offsets
+
+    def mark_committed(self, offsets):
+        for tp, offset in offsets.items():
+            partition = self._partitions.get(tp)
+            if partition is not None:
+                partition.committed = offset
+
+    def forget(self, tps):
+        """Drop partitions this worker no longer owns (after a rebalance)."""
+        tps = set(tps)
+        for tp in tps:
+            self._partitions.pop(tp, None)
+        self._jobs = {key: origin for key, origin in self._jobs.items() if origin[0] not in tps}
@@ -4,3 +4,6 @@ class Probe(ABC):
     @abstractmethod
     async def run(self, job: dict) -> dict:
         pass
+
+    async def close(self):
+        pass
@@ -0,0 +1,137 @@
+import os
+import time
+import socket
+import asyncio
+import ipaddress
+
+try:
+    import aiodns
+except ImportError:  # fall back to the loop's getaddrinfo, which has no TTLs
+    aiodns = None
+
+# TTL used when the resolver does not report one (plain getaddrinfo)
+DEFAULT_TTL = int(os.environ.get("DNS_CACHE_DEFAULT_TTL", "60"))
+MIN_TTL = int(os.environ.get("DNS_CACHE_MIN_TTL", "5"))
+MAX_TTL = int(os.environ.get("DNS_CACHE_MAX_TTL", "3600"))
+NEGATIVE_TTL = int(os.environ.get("DNS_CACHE_NEGATIVE_TTL", "30"))
+MAX_ENTRIES = int(os.environ.get("DNS_CACHE_MAX_ENTRIES", "10000"))
+
+
+class _LookupAbandoned(Exception):
+    pass
+
+
+class DnsCache:
+    """Process-wide async resolver cache.
+
+    Entries live for the record TTL (clamped to MIN_TTL..MAX_TTL), failures
+    are cached for NEGATIVE_TTL, and concurrent lookups of the same name share
+    a single query.
+    """
+
+    def __init__(self):
+        self._entries = {}  # host -> (expires_at, addresses, error)
+        self._inflight = {}  # host -> Future
+        self._resolver = None
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.collapsed = 0
+
+    async def resolve(self, host: str, bypass: bool = False) -> list[str]:
+        """Return the addresses for host, from cache unless bypass is set."""
+        try:
+            ipaddress.ip_address(host)
+            return [host]
+        except ValueError:
+            pass
+
+        if bypass:
+            addresses, _ = await self._lookup(host)
+            return addresses
+
+        entry = self._entries.get(host)
+        if entry and entry[0] > time.monotonic():
+            if entry[2] is not None:
+                self.negative_hits += 1
+                raise socket.gaierror(entry[2])
+            self.hits += 1
+            return entry[1]
+
+        fut = self._inflight.get(host)
+        while fut is not None:
+            self.collapsed += 1
+            try:
+                return await asyncio.shield(fut)
+            except _LookupAbandoned:
+                # The caller running the lookup was cancelled (e.g. by its own
+                # timeout); run the lookup here instead, unless another waiter
+                # already took over
+                fut = self._inflight.get(host)
+
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[host] = fut
+        try:
+            try:
+                addresses, ttl = await self._lookup(host)
+            except Exception as e:
+                self._store(host, NEGATIVE_TTL, None, str(e))
+                fut.set_exception(e)
+                fut.exception()  # mark retrieved when nobody else is waiting
+                raise
+            self._store(host, ttl, addresses, None)
+            fut.set_result(addresses)
+            return addresses
+        finally:
+            del self._inflight[host]
+            if not fut.done():
+                # Cancelled mid-lookup: CancelledError is not an Exception, so
+                # wake the other waiters here or they wait forever
+                fut.set_exception(_LookupAbandoned())
+                fut.exception()
+
+    async def _lookup(self, host):
+        if aiodns is not None:
+            if self._resolver is None:
+                self._resolver = aiodns.DNSResolver()
+            try:
+                res = await self._resolver.getaddrinfo(host, type=socket.SOCK_STREAM)
+                nodes = res.nodes
+            except aiodns.error.DNSError as e:
+                raise socket.gaierror(e.args[-1]) from None
+            if not nodes:
+                raise socket.gaierror(f"no addresses for {host}")
+            addresses = []
+            for node in nodes:
+                addr = node.addr[0]
+                addr = addr.decode() if isinstance(addr, bytes) else addr
+                if addr not in addresses:
+                    addresses.append(addr)
+            return addresses, min(node.ttl for node in nodes)
+
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        return addresses, DEFAULT_TTL
+
+    def _store(self, host, ttl, addresses, error):
+        if error is None:
+            ttl = min(max(ttl, MIN_TTL), MAX_TTL)
+        if len(self._entries) >= MAX_ENTRIES and host not in self._entries:
+            # Dicts keep insertion order, so this drops the oldest entry
+            del self._entries[next(iter(self._entries))]
+        self._entries[host] = (time.monotonic() + ttl, addresses, error)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "collapsed": self.collapsed,
+            "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+        }
+
+
+dns_cache = DnsCache()
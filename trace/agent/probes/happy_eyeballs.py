@@ -0,0 +1,70 @@
+import os
+import time
+import asyncio
+import ipaddress
+
+# How long an attempt gets before the next address is tried alongside it,
+# the "Connection Attempt Delay" of RFC 8305
+ATTEMPT_DELAY = float(os.environ.get("CONNECT_ATTEMPT_DELAY", "0.25"))
+
+
+def interleave(addresses: list[str]) -> list[str]:
+    """Alternate address families, starting with the resolver's first choice."""
+    if len(addresses) < 2:
+        return list(addresses)
+    first = ipaddress.ip_address(addresses[0]).version
+    preferred = [a for a in addresses if ipaddress.ip_address(a).version == first]
+    other = [a for a in addresses if ipaddress.ip_address(a).version != first]
+    mixed = []
+    for i in range(max(len(preferred), len(other))):
+        mixed.extend(preferred[i:i + 1] + other[i:i + 1])
+    return mixed
+
+
+async def connect_first(connect, addresses, close, delay=ATTEMPT_DELAY):
+    """Race connect(address) over addresses, Happy Eyeballs style (RFC 8305).
+
+    The next address is tried once the previous attempt fails or has had
+    delay seconds, so a host with broken IPv6 costs one short head start
+    rather than a full connect timeout. Returns (connection, address,
+    started), where started is the perf_counter time the winning attempt
+    began, so callers can time that attempt alone. Connections that lose the
+    race are passed to the async close(). Raises the last error if every
+    attempt fails.
+    """
+    addresses = interleave(addresses)
+    attempts = {}  # task -> (address, started)
+    pending = set()
+    winners = []
+    error = None
+    try:
+        i = 0
+        while not winners and (i < len(addresses) or pending):
+            timeout = None
+            if i < len(addresses):
+                task = asyncio.ensure_future(connect(addresses[i]))
+                attempts[task] = (addresses[i], time.perf_counter())
+                pending.add(task)
+                i += 1
+                if i < len(addresses):
+                    timeout = delay
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winners.append(task)
+                else:
+                    error = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        # An attempt can complete while being cancelled; close those too
+        late = [t for t in pending if not t.cancelled() and t.exception() is None]
+        for task in winners[1:] + late:
+            await close(task.result())
+
+    if not winners:
+        raise error
+    address, started = attempts[winners[0]]
+    return winners[0].result(), address, started
@@ -0,0 +1,81 @@
+import time
+import asyncio
+
+# Largest response head we accept; the buffer is allocated once per response
+MAX_HEAD_BYTES = 16384
+BODY_CHUNK_BYTES = 65536
+
+
+async def read_response_head(reader: asyncio.StreamReader, timeout: float) -> dict:
+    """Read an HTTP/1.1 status line and headers into a preallocated buffer.
+
+    Returns as soon as the blank line after the headers has been seen, without
+    touching the rest of the body. ``body_bytes`` is the number of body bytes
+    that arrived in the same reads as the head.
+    """
+    buf = bytearray(MAX_HEAD_BYTES)
+    view = memoryview(buf)
+    filled = 0
+    first_byte_at = None
+
+    while True:
+        chunk = await asyncio.wait_for(reader.read(MAX_HEAD_BYTES - filled), timeout)
+        if not chunk:
+            raise ConnectionError("connection closed before response headers were complete")
+        if first_byte_at is None:
+            first_byte_at = time.perf_counter()
+
+        view[filled:filled + len(chunk)] = chunk
+        # The terminator can straddle two reads, so back up a few bytes
+        search_from = max(0, filled - 3)
+        filled += len(chunk)
+        end = buf.find(b"\r\n\r\n", search_from, filled)
+        if end != -1:
+            break
+        if filled == MAX_HEAD_BYTES:
+            raise ValueError(f"response headers exceed {MAX_HEAD_BYTES} bytes")
+
+    status_line, *header_lines = bytes(view[:end]).split(b"\r\n")
+    parts = status_line.split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith(b"HTTP/"):
+        raise ValueError(f"malformed status line: {status_line[:64]!r}")
+
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(b":")
+        headers[name.strip().lower().decode("latin-1")] = value.strip().decode("latin-1")
+
+    return {
+        "status_code": int(parts[1]),
+        "headers": headers,
+        "first_byte_at": first_byte_at,
+        "body_bytes": filled - (end + 4),
+    }
+
+
+async def drain_body(reader: asyncio.StreamReader, head: dict, max_bytes: int, timeout: float) -> dict:
+    """Read and discard the response body, stopping at EOF, Content-Length or max_bytes.
+
+    Only the byte count is kept. For chunked responses the count includes the
+    chunk framing, since the body is not decoded.
+    """
+    received = head["body_bytes"]
+    limit = max_bytes
+    length = head["headers"].get("content-length")
+    if length and length.isdigit():
+        limit = min(int(length), max_bytes)
+
+    eof = False
+    while received < limit:
+        chunk = await asyncio.wait_for(reader.read(min(BODY_CHUNK_BYTES, limit - received)), timeout)
+        if not chunk:
+            eof = True
+            break
+        received += len(chunk)
+
+    if length is not None and length.isdigit():
+        # EOF before Content-Length bytes means the connection was cut short
+        complete = received >= int(length)
+    else:
+        complete = eof
+    return {"body_bytes": received, "body_truncated": not complete}
@@ -1,8 +1,113 @@
+import os
 import time
+import socket
+import asyncio
+import contextlib
+import contextvars
 import httpx
+import httpcore
 from probes.base import Probe
+from probes.dns_cache import dns_cache
+from probes.happy_eyeballs import connect_first
+
+# Connections kept per host, shared by all jobs hitting that host
+MAX_CONNECTIONS_PER_HOST = int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", "10"))
+MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "1000"))
+KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP2_DEFAULT = os.environ.get("HTTP_ENABLE_HTTP2", "0") == "1"
+
+# Set per job so the backend below can skip the cache for DNS measurements
+_bypass_dns = contextvars.ContextVar("bypass_dns", default=False)
+
+
+class _CachingNetworkBackend(httpcore.AsyncNetworkBackend):
+    """Resolves hostnames through the shared DNS cache before connecting.
+
+    httpcore passes the original hostname separately for TLS, so SNI and
+    certificate checks are unaffected by connecting to the IP.
+    """
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        # httpcore's connect timeout used to cover name resolution; keep it that way
+        try:
+            addresses = await asyncio.wait_for(dns_cache.resolve(host, bypass=_bypass_dns.get()), timeout)
+        except asyncio.TimeoutError:
+            raise httpcore.ConnectTimeout(f"DNS lookup for {host} timed out") from None
+        stream, _, _ = await connect_first(
+            lambda address: self._backend.connect_tcp(
+                address, port, timeout=timeout, local_address=local_address, socket_options=socket_options
+            ),
+            addresses, _close_stream,
+        )
+        return stream
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds):
+        await self._backend.sleep(seconds)
+
+
+async def _close_stream(stream):
+    await stream.aclose()
+
+
+def _error_kind(e):
+    if isinstance(e, socket.gaierror):
+        return "dns"
+    if isinstance(e, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(e, httpx.ConnectError):
+        return "connect"
+    if isinstance(e, httpx.ProtocolError):
+        return "protocol"
+    if isinstance(e, httpx.NetworkError):
+        return "network"
+    return "other"
+
 
 class HttpProbe(Probe):
+    def __init__(self):
+        self._clients = {}
+        self._host_limits = {}  # host -> [semaphore, jobs holding or waiting for it]
+
+    def _get_client(self, http2: bool) -> httpx.AsyncClient:
+        client = self._clients.get(http2)
+        if client is None:
+            transport = httpx.AsyncHTTPTransport(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+            )
+            # httpx does not expose the network backend, so swap it on the pool
+            transport._pool._network_backend = _CachingNetworkBackend(transport._pool._network_backend)
+            client = httpx.AsyncClient(transport=transport, timeout=10)
+            self._clients[http2] = client
+        return client
+
+    @contextlib.asynccontextmanager
+    async def _host_limit(self, host: str):
+        # httpx only limits the pool as a whole, so cap per-host concurrency
+        # here. An entry lives only while jobs for its host run or wait, so
+        # the dict doesn't grow with every host ever probed.
+        entry = self._host_limits.get(host)
+        if entry is None:
+            entry = self._host_limits[host] = [asyncio.Semaphore(MAX_CONNECTIONS_PER_HOST), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._host_limits[host]
+
     async def run(self, job: dict) -> dict:
         url = job.get("url")
         method = job.get("method", "GET")
@@ -14,15 +119,38 @@ class HttpProbe(Probe):
             "status_code": 0,
             "success": False,
             "error": None,
+            "connection_reused": None,
+            "http_version": None,
         }
 
+        # httpcore reports every phase through the trace extension; a request
+        # that never opens a TCP connection went out on a pooled one.
+        connected = False
+
+        async def trace(event_name, info):
+            nonlocal connected
+            if event_name == "connection.connect_tcp.started":
+                connected = True
+
+        _bypass_dns.set(job.get("bypass_dns_cache", False))
         try:
-            start = time.time()
-            r = httpx.request(method, url, timeout=10)
-            result["elapsed_ms"] = (time.time() - start) * 1000
+            http2 = job.get("http2")
+            client = self._get_client(HTTP2_DEFAULT if http2 is None else http2)
+            async with self._host_limit(httpx.URL(url).host):
+                start = time.time()
+                r = await client.request(method, url, extensions={"trace": trace})
+                result["elapsed_ms"] = (time.time() - start) * 1000
             result["status_code"] = r.status_code
             result["success"] = r.status_code < 400
+            result["connection_reused"] = not connected
+            result["http_version"] = r.http_version
         except Exception as e:
             result["error"] = str(e)
+            result["error_kind"] = _error_kind(e)
 
         return result
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
@@ -1,8 +1,41 @@
-import socket
 import ssl
 import time
+import asyncio
 from urllib.parse import urlparse
 from probes.base import Probe
+from probes.dns_cache import dns_cache
+from probes.happy_eyeballs import connect_first
+from probes.http11 import read_response_head, drain_body
+from probes.tls_sessions import TlsSessionCache
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+# Default cap for jobs with read_body set
+MAX_BODY_BYTES = 1024 * 1024
+
+# Shared by every job so handshakes can resume earlier sessions
+verified_sessions = TlsSessionCache()
+unverified_sessions = TlsSessionCache(verify=False)
+
+
+def _ms_since(t):
+    return (time.perf_counter() - t) * 1000
+
+
+async def _close_stream(connection):
+    connection[1].close()
+
+
+def _first_failed_stage(result):
+    for flag, kind in (("dns_ok", "dns"), ("tcp_ok", "connect"), ("ssl_ok", "tls"),
+                       ("send_ok", "send"), ("recv_ok", "receive")):
+        # A certificate error falls back to an unverified connection and carries on
+        if flag == "ssl_ok" and result.get("ssl_cert_error"):
+            continue
+        if not result[flag]:
+            return kind
+    return "other"
+
 
 class HttpsProbe(Probe):
     async def run(self, job: dict) -> dict:
@@ -21,19 +54,31 @@ class HttpsProbe(Probe):
             "recv_ok": False,
             "status_code": 0,
             "elapsed_ms": 0,
+            "dns_ms": None,
+            "connect_ms": None,
+            "tls_ms": None,
+            "ttfb_ms": None,
+            "total_ms": None,
+            "body_ms": None,
+            "body_bytes": None,
+            "tls_resumed": None,
             "success": False,
             "error": None
         }
 
         errors = []
-        sock = None
-        ssl_sock = None
-        start_time = time.time()
+        reader = writer = None
+        start_time = time.perf_counter()
 
         try:
             # DNS
             try:
-                ip = socket.gethostbyname(host)
+                t = time.perf_counter()
+                addresses = await asyncio.wait_for(
+                    dns_cache.resolve(host, bypass=job.get("bypass_dns_cache", False)),
+                    CONNECT_TIMEOUT,
+                )
+                result["dns_ms"] = _ms_since(t)
                 result["dns_ok"] = True
             except Exception as e:
                 errors.append(f"DNS: {e}")
@@ -41,66 +86,104 @@ class HttpsProbe(Probe):
             # TCP
             if result["dns_ok"]:
                 try:
-                    sock = socket.create_connection((ip, port), timeout=5)
+                    (reader, writer), ip, t = await connect_first(
+                        lambda ip: asyncio.wait_for(asyncio.open_connection(ip, port), CONNECT_TIMEOUT),
+                        addresses, _close_stream,
+                    )
+                    # Only the attempt that connected, not the ones raced against it
+                    result["connect_ms"] = _ms_since(t)
                     result["tcp_ok"] = True
                 except Exception as e:
                     errors.append(f"TCP: {e}")
 
             # SSL
             if result["tcp_ok"]:
+                # Every probe verifies the certificate afresh, so a fixed
+                # certificate is reported as soon as it is deployed
                 try:
-                    context = ssl.create_default_context()
-                    ssl_sock = context.wrap_socket(sock, server_hostname=host)
+                    t = time.perf_counter()
+                    result["tls_resumed"] = await verified_sessions.start_tls(
+                        writer, host, port, CONNECT_TIMEOUT
+                    )
+                    result["tls_ms"] = _ms_since(t)
                     result["ssl_ok"] = True
+                    sessions = verified_sessions
                 except ssl.SSLCertVerificationError as e:
-                    result["ssl_ok"] = False
                     result["ssl_cert_error"] = str(e)
 
-                    # Optionally: retry with unverified context to continue the request
+                    # A failed handshake leaves the socket unusable, so
+                    # reconnect; connect_ms then times the socket actually used
+                    writer.close()
+                    writer = None
+                    try:
+                        t = time.perf_counter()
+                        reader, writer = await asyncio.wait_for(
+                            asyncio.open_connection(ip, port), CONNECT_TIMEOUT
+                        )
+                        result["connect_ms"] = _ms_since(t)
+                    except Exception as e2:
+                        result["error"] = f"SSL fallback failed: {e2}"
+                        result["error_kind"] = "connect"
+                        return result
+                except Exception as e:
+                    errors.append(f"SSL: {e}")
+
+                # Carry on without verification to still measure the request
+                if result.get("ssl_cert_error"):
                     try:
-                        context = ssl._create_unverified_context()
-                        ssl_sock = context.wrap_socket(sock, server_hostname=host)
+                        t = time.perf_counter()
+                        result["tls_resumed"] = await unverified_sessions.start_tls(
+                            writer, host, port, CONNECT_TIMEOUT
+                        )
+                        result["tls_ms"] = _ms_since(t)
+                        sessions = unverified_sessions
                     except Exception as e2:
                         result["error"] = f"SSL fallback failed: {e2}"
+                        result["error_kind"] = "tls"
                         return result
 
             # Send
-            if ssl_sock:
+            if writer and (result["ssl_ok"] or result.get("ssl_cert_error")):
                 try:
-                    request = f"GET {parsed.path or '/'} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n"
-                    ssl_sock.sendall(request.encode())
+                    target = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+                    request = f"GET {target} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n"
+                    writer.write(request.encode())
+                    await writer.drain()
+                    sent_at = time.perf_counter()
                     result["send_ok"] = True
                 except Exception as e:
                     errors.append(f"Send: {e}")
 
             # Receive
-            if ssl_sock and result["send_ok"]:
+            if writer and result["send_ok"]:
                 try:
-                    response = b""
-                    while True:
-                        chunk = ssl_sock.recv(4096)
-                        if not chunk:
-                            break
-                        response += chunk
+                    head = await read_response_head(reader, READ_TIMEOUT)
+                    result["ttfb_ms"] = (head["first_byte_at"] - sent_at) * 1000
+                    result["status_code"] = head["status_code"]
                     result["recv_ok"] = True
+                    sessions.store(writer, host, port)
 
-                    # Parse HTTP status
-                    status_line = response.split(b"\r\n", 1)[0]
-                    if b" " in status_line:
-                        result["status_code"] = int(status_line.split()[1])
+                    if job.get("read_body", False):
+                        t = time.perf_counter()
+                        body = await drain_body(
+                            reader, head, job.get("max_body_bytes") or MAX_BODY_BYTES, READ_TIMEOUT
+                        )
+                        result["body_ms"] = _ms_since(t)
+                        result.update(body)
                 except Exception as e:
                     errors.append(f"Receive: {e}")
 
         finally:
-            result["elapsed_ms"] = (time.time() - start_time) * 1000
+            result["total_ms"] = _ms_since(start_time)
+            result["elapsed_ms"] = result["total_ms"]
             try:
-                if ssl_sock:
-                    ssl_sock.close()
-                elif sock:
-                    sock.close()
+                if writer:
+                    writer.close()
             except:
                 pass
 
         result["success"] = result["status_code"] < 400 if result["status_code"] else False
         result["error"] = "; ".join(errors) if errors else None
+        if errors:
+            result["error_kind"] = _first_failed_stage(result)
         return result
@@ -0,0 +1,80 @@
+import os
+import ssl
+import asyncio
+import contextvars
+
+MAX_SESSIONS = int(os.environ.get("TLS_SESSION_CACHE_SIZE", "10000"))
+
+# asyncio creates the SSLObject itself and has no way to pass a session, so
+# the session to offer is handed to wrap_bio through a context variable.
+_offer = contextvars.ContextVar("tls_session_offer", default=None)
+
+
+class _ResumingContext(ssl.SSLContext):
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        return super().wrap_bio(
+            incoming, outgoing,
+            server_side=server_side,
+            server_hostname=server_hostname,
+            session=session or _offer.get(),
+        )
+
+
+class TlsSessionCache:
+    """One SSLContext per agent plus the last session seen for each (host, port)."""
+
+    def __init__(self, verify: bool = True):
+        context = _ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+        if verify:
+            context.load_default_certs()
+        else:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        self.context = context
+        self._sessions = {}
+        self.resumed = 0
+        self.full = 0
+
+    def _session(self, host, port):
+        # Expired sessions are harmless: the server just falls back to a full handshake
+        return self._sessions.get((host, port))
+
+    async def start_tls(self, writer: asyncio.StreamWriter, host: str, port: int, timeout: float):
+        token = _offer.set(self._session(host, port))
+        try:
+            await asyncio.wait_for(writer.start_tls(self.context, server_hostname=host), timeout)
+        finally:
+            _offer.reset(token)
+        return self._record(writer)
+
+    def _record(self, writer):
+        resumed = writer.get_extra_info("ssl_object").session_reused
+        if resumed:
+            self.resumed += 1
+        else:
+            self.full += 1
+        return resumed
+
+    def store(self, writer: asyncio.StreamWriter, host: str, port: int):
+        """Keep the connection's session for the next handshake with host:port.
+
+        TLS 1.3 servers send tickets after the handshake, so call this once
+        some response data has been read.
+        """
+        ssl_object = writer.get_extra_info("ssl_object")
+        session = ssl_object.session if ssl_object else None
+        if session is None:
+            return
+        key = (host, port)
+        if len(self._sessions) >= MAX_SESSIONS and key not in self._sessions:
+            del self._sessions[next(iter(self._sessions))]
+        self._sessions[key] = session
+
+    def stats(self) -> dict:
+        handshakes = self.resumed + self.full
+        return {
+            "sessions": len(self._sessions),
+            "resumed": self.resumed,
+            "full": self.full,
+            "resumption_rate": self.resumed / handshakes if handshakes else 0.0,
+        }
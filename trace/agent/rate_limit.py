@@ -0,0 +1,149 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from shared.transport import job_host
+
+# Requests per second allowed per host, and how many may go out back to back.
+# A job can override both with rate_limit / rate_burst. 0 disables the limit.
+HOST_RATE = float(os.environ.get("RATE_LIMIT_PER_HOST", "10"))
+HOST_BURST = int(os.environ.get("RATE_BURST_PER_HOST", "10"))
+GLOBAL_RATE = float(os.environ.get("RATE_LIMIT_GLOBAL", "0"))
+GLOBAL_BURST = int(os.environ.get("RATE_BURST_GLOBAL", "100"))
+# Delayed jobs held for one host before the partition feeding it is paused
+MAX_DELAYED_PER_HOST = int(os.environ.get("RATE_LIMIT_MAX_DELAYED_PER_HOST", "1000"))
+# Delayed jobs held in total before every partition is paused
+MAX_DELAYED = int(os.environ.get("RATE_LIMIT_MAX_DELAYED", "100000"))
+# Host buckets kept before idle ones are pruned
+MAX_HOSTS = 10000
+
+
+class TokenBucket:
+    """Token bucket in GCRA form: one theoretical arrival time instead of a token count.
+
+    reserve() always succeeds and returns when the caller may go, so callers
+    queue up behind each other instead of being rejected.
+    """
+
+    __slots__ = ("interval", "tolerance", "tat")
+
+    def __init__(self, rate, burst):
+        self.tat = 0.0
+        self.configure(rate, burst)
+
+    def configure(self, rate, burst):
+        self.interval = 1 / rate
+        self.tolerance = (max(burst, 1) - 1) * self.interval
+
+    def reserve(self, now):
+        at = max(now, self.tat - self.tolerance)
+        self.tat = max(self.tat, at) + self.interval
+        return at
+
+
+class RateLimiter:
+    """Per-host and global rate limits for the worker.
+
+    Jobs over a limit are parked in a heap ordered by the time they may run
+    and released from there; nothing is dropped. The global bucket is only
+    charged once a job has cleared its host bucket, so a throttled host never
+    holds global capacity that other hosts could use now.
+    """
+
+    def __init__(self, host_rate=HOST_RATE, host_burst=HOST_BURST,
+                 global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST, max_delayed=MAX_DELAYED,
+                 max_delayed_per_host=MAX_DELAYED_PER_HOST):
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.max_delayed = max_delayed
+        self.max_delayed_per_host = max_delayed_per_host
+        self._global = TokenBucket(global_rate, global_burst) if global_rate > 0 else None
+        self._hosts = {}
+        self._heap = []  # (run_at, seq, job, global_cleared)
+        self._held = {}  # host -> jobs of it in the heap
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+
+    @property
+    def delayed(self):
+        return len(self._heap)
+
+    def throttled_hosts(self) -> list:
+        """Hosts holding at least max_delayed_per_host delayed jobs."""
+        return [host for host, held in self._held.items() if held >= self.max_delayed_per_host]
+
+    def _host_bucket(self, job, now):
+        rate = job.get("rate_limit")
+        if rate is None:
+            rate = self.host_rate
+        if rate <= 0:
+            return None
+        burst = job.get("rate_burst")
+        if burst is None:
+            burst = self.host_burst
+        host = job_host(job)
+        bucket = self._hosts.get(host)
+        if bucket is None:
+            if len(self._hosts) >= MAX_HOSTS:
+                self._hosts = {h: b for h, b in self._hosts.items() if b.tat > now}
+            bucket = self._hosts[host] = TokenBucket(rate, burst)
+        elif job.get("rate_limit") is not None or job.get("rate_burst") is not None:
+            bucket.configure(rate, burst)
+        return bucket
+
+    def _push(self, run_at, job, global_cleared):
+        if not self._heap or run_at < self._heap[0][0]:
+            self._changed.set()
+        heapq.heappush(self._heap, (run_at, next(self._seq), job, global_cleared))
+        host = job_host(job)
+        self._held[host] = self._held.get(host, 0) + 1
+
+    def _clear_global(self, job, now, ready):
+        if self._global is not None:
+            run_at = self._global.reserve(now)
+            if run_at > now:
+                self._push(run_at, job, True)
+                return
+        ready.append(job)
+
+    def admit(self, jobs) -> list:
+        """Return the jobs that may run now; the rest are held until their turn."""
+        now = time.monotonic()
+        ready = []
+        for job in jobs:
+            bucket = self._host_bucket(job, now)
+            run_at = bucket.reserve(now) if bucket else now
+            if run_at > now:
+                self._push(run_at, job, False)
+            else:
+                self._clear_global(job, now, ready)
+        return ready
+
+    def release_due(self) -> list:
+        """Pop the held jobs whose time has come."""
+        now = time.monotonic()
+        ready = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, job, global_cleared = heapq.heappop(self._heap)
+            host = job_host(job)
+            if self._held[host] == 1:
+                del self._held[host]
+            else:
+                self._held[host] -= 1
+            if global_cleared:
+                ready.append(job)
+            else:
+                self._clear_global(job, now, ready)
+        return ready
+
+    async def wait_due(self):
+        """Sleep until the earliest held job is due or an earlier one arrives."""
+        self._changed.clear()
+        timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+        if timeout is not None and timeout <= 0:
+            return
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,152 @@
+import os
+import time
+import queue
+import asyncio
+import multiprocessing as mp
+import worker
+from shared.metrics import Registry, start_http_server
+
+# One worker per core by default. All workers join the same consumer group,
+# so processes beyond the partition count of http_test_requests sit idle.
+PROCESSES = int(os.environ.get("AGENT_PROCESSES", str(os.cpu_count() or 1)))
+REPORT_INTERVAL = float(os.environ.get("AGENT_REPORT_INTERVAL", "10"))
+MAX_RESTART_DELAY = 30
+
+
+def run_worker(worker_id, stats_queue):
+    asyncio.run(worker.main(stats_queue=stats_queue, worker_id=worker_id))
+
+
+class Supervisor:
+    def __init__(self, processes):
+        self.ctx = mp.get_context("spawn")
+        self.processes = processes
+        self.stats_queue = self.ctx.Queue()
+        self.children = {}
+        self.restarts = {}  # worker_id -> (consecutive crashes, restart at)
+        self.latest = {}
+        self.previous = {}
+        self.restart_count = 0
+        # Counters and histograms of workers that exited, so the agent's
+        # totals don't drop (which Prometheus would read as a reset)
+        self.retired = {}
+        # Their done/failed counts, so the totals in summary() keep growing too
+        self.retired_done = 0
+        self.retired_failed = 0
+
+    def start(self, worker_id):
+        p = self.ctx.Process(
+            target=run_worker, args=(worker_id, self.stats_queue), name=f"worker-{worker_id}"
+        )
+        p.start()
+        self.children[worker_id] = p
+        print(f"Started worker {worker_id} (pid {p.pid})")
+
+    def check_children(self):
+        now = time.monotonic()
+        for worker_id, p in list(self.children.items()):
+            if p is not None and not p.is_alive():
+                crashes = self.restarts.get(worker_id, (0, 0))[0] + 1
+                delay = min(2 ** (crashes - 1), MAX_RESTART_DELAY)
+                print(f"Worker {worker_id} exited with code {p.exitcode}, restarting in {delay}s")
+                self.children[worker_id] = None
+                self.retire(self.latest.pop(worker_id, None))
+                self.previous.pop(worker_id, None)
+                self.restarts[worker_id] = (crashes, now + delay)
+                self.restart_count += 1
+
+        for worker_id, (crashes, restart_at) in list(self.restarts.items()):
+            if self.children.get(worker_id) is None and restart_at <= now:
+                self.start(worker_id)
+            elif self.children.get(worker_id) is not None and restart_at + MAX_RESTART_DELAY <= now:
+                # Stayed up long enough to reset the backoff
+                del self.restarts[worker_id]
+
+    def collect_stats(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                snapshot = self.stats_queue.get(timeout=remaining)
+            except queue.Empty:
+                return
+            worker_id = snapshot["worker"]
+            child = self.children.get(worker_id)
+            if child is None or snapshot.get("pid", child.pid) != child.pid:
+                continue  # sent by a worker that has since exited and been retired
+            if worker_id in self.latest:
+                self.previous[worker_id] = self.latest[worker_id]
+            self.latest[worker_id] = snapshot
+
+    def summary(self):
+        throughput = 0.0
+        done, failed = self.retired_done, self.retired_failed
+        lag = {}
+        for worker_id, snapshot in self.latest.items():
+            done += snapshot["done"]
+            failed += snapshot["failed"]
+            lag.update(snapshot["lag"])
+            prev = self.previous.get(worker_id)
+            if prev and snapshot["time"] > prev["time"]:
+                throughput += (snapshot["done"] - prev["done"]) / (snapshot["time"] - prev["time"])
+        return {
+            "workers": sum(1 for p in self.children.values() if p is not None and p.is_alive()),
+            "done": done,
+            "failed": failed,
+            "probes_per_sec": throughput,
+            "lag": sum(lag.values()),
+            "lag_by_partition": lag,
+        }
+
+    def retire(self, snapshot):
+        if not snapshot:
+            return
+        self.retired_done += snapshot["done"]
+        self.retired_failed += snapshot["failed"]
+        if "metrics" not in snapshot:
+            return
+        # Gauges describe the dead process's current state, so they go
+        cumulative = {name: m for name, m in snapshot["metrics"].items() if m["type"] != "gauge"}
+        self.retired = Registry.merged([self.retired, cumulative]).snapshot()
+
+    def render_metrics(self):
+        # Each worker reports cumulative values every STATS_INTERVAL, so the
+        # agent's are their sum, at most one interval old
+        latest = list(self.latest.values())
+        registry = Registry.merged([self.retired] + [s["metrics"] for s in latest if "metrics" in s])
+        alive = sum(1 for p in list(self.children.values()) if p is not None and p.is_alive())
+        registry.gauge("trace_agent_workers", "Worker processes running").set(alive)
+        registry.counter("trace_agent_worker_restarts_total", "Worker processes restarted after exiting").inc(
+            amount=self.restart_count
+        )
+        return registry.render()
+
+    def run(self):
+        if worker.METRICS_PORT:
+            start_http_server(worker.METRICS_PORT, self.render_metrics)
+        for worker_id in range(self.processes):
+            self.start(worker_id)
+        try:
+            while True:
+                self.collect_stats(REPORT_INTERVAL)
+                self.check_children()
+                s = self.summary()
+                print(
+                    f"{s['workers']}/{self.processes} workers - {s['probes_per_sec']:.1f} probes/s - "
+                    f"done {s['done']} failed {s['failed']} - lag {s['lag']}"
+                )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for p in self.children.values():
+                if p is not None:
+                    p.terminate()
+            for p in self.children.values():
+                if p is not None:
+                    p.join(5)
+
+
+if __name__ == "__main__":
+    Supervisor(PROCESSES).run()
@@ -1,44 +1,292 @@
+import os
 import time
 import asyncio
-from shared.kafka_util import get_consumer, get_producer
+from concurrent.futures import ThreadPoolExecutor
+from shared.transport import get_consumer, get_producer, job_host, commit
+from shared.metrics import Registry, start_http_server, process_rss_bytes
 from probes.http_probe import HttpProbe
-from probes.https_probe import HttpsProbe
+from probes.https_probe import HttpsProbe, verified_sessions, unverified_sessions
+from probes.dns_cache import dns_cache
+from rate_limit import RateLimiter
+from offsets import OffsetTracker
 
-consumer = get_consumer("http_test_requests", "http-test-worker")
-producer = get_producer()
-loop = asyncio.get_event_loop()
+# Max number of probes in flight at once
+CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", "200"))
+# Max number of messages fetched from Kafka per poll
+POLL_BATCH = int(os.environ.get("WORKER_POLL_BATCH", "500"))
+POLL_TIMEOUT_MS = int(os.environ.get("WORKER_POLL_TIMEOUT_MS", "1000"))
+# Max same-host jobs run back to back by one runner
+MAX_GROUP_SIZE = int(os.environ.get("WORKER_MAX_GROUP_SIZE", "20"))
+# Hosts whose partition is remembered for pausing it
+MAX_TRACKED_HOSTS = 10000
+# How often stats are pushed to the supervisor, when running under one
+STATS_INTERVAL = float(os.environ.get("WORKER_STATS_INTERVAL", "5"))
+# How often offsets of finished jobs are committed
+COMMIT_INTERVAL_MS = int(os.environ.get("WORKER_COMMIT_INTERVAL_MS", "1000"))
+# Port for the Prometheus metrics endpoint (served by the supervisor in
+# multi-process mode); 0 disables it
+METRICS_PORT = int(os.environ.get("AGENT_METRICS_PORT", "9464"))
 
 probe_map = {
     "http": HttpProbe(),
     "https": HttpsProbe(),
 }
 
-print("Worker started...")
+stats = {"done": 0, "failed": 0}
 
-for msg in consumer:
-    job = msg.value
+metrics = Registry()
+queue_wait = metrics.histogram(
+    "trace_job_queue_wait_seconds", "Time from central accepting a job to a worker polling it")
+worker_wait = metrics.histogram(
+    "trace_job_worker_wait_seconds", "Time from polling a job to starting its probe (rate limits, busy runners)")
+probe_duration = metrics.histogram(
+    "trace_probe_duration_seconds", "Time from starting a probe to its result being ready")
+probes_total = metrics.counter("trace_probes_total", "Probes completed", ("type", "success"))
+probe_errors = metrics.counter("trace_probe_errors_total", "Failed probes by kind of failure", ("type", "kind"))
+probes_in_flight = metrics.gauge("trace_probes_in_flight", "Probes running right now")
+probes_in_flight.set(0)
+# Set up in main(), where the tracker and rate limiter live
+jobs_pending = metrics.gauge("trace_jobs_pending", "Jobs polled but not finished, including rate-limited ones")
+jobs_delayed = metrics.gauge("trace_jobs_rate_limited", "Jobs held back by the rate limiter")
+consumer_lag_jobs = metrics.gauge(
+    "trace_consumer_lag", "Jobs not yet polled from each assigned partition", ("topic", "partition"))
+metrics.gauge("trace_agent_memory_bytes", "Resident memory", fn=lambda: {(): process_rss_bytes()})
+metrics.counter(
+    "trace_dns_cache_lookups_total", "DNS cache lookups by outcome", ("result",),
+    fn=lambda: {("hit",): dns_cache.hits, ("negative_hit",): dns_cache.negative_hits, ("miss",): dns_cache.misses},
+)
+metrics.gauge("trace_dns_cache_entries", "Hostnames in the DNS cache", fn=lambda: {(): len(dns_cache._entries)})
+metrics.counter(
+    "trace_tls_handshakes_total", "HTTPS probe handshakes by whether a session was resumed", ("verify", "resumed"),
+    fn=lambda: {
+        ("true", "true"): verified_sessions.resumed, ("true", "false"): verified_sessions.full,
+        ("false", "true"): unverified_sessions.resumed, ("false", "false"): unverified_sessions.full,
+    },
+)
+
+
+async def run_job(job, producer):
     job_type = job.get("type", "http")
     probe = probe_map.get(job_type)
 
     if not probe:
         print(f"Unknown probe type: {job_type}")
-        continue
+        return
 
     result = {
         "url": job.get("url"),
         "method": job.get("method", "GET"),
         "type": job_type,
     }
+    if job.get("batch_id"):
+        result["batch_id"] = job["batch_id"]
+    if job.get("enqueued_at"):
+        result["enqueued_at"] = job["enqueued_at"]
+    result["picked_at"] = job["picked_at"]
+    result["started_at"] = time.time()
+    worker_wait.observe(result["started_at"] - result["picked_at"])
 
+    probes_in_flight.inc()
     try:
-        result.update(loop.run_until_complete(probe.run(job)))
+        result.update(await probe.run(job))
     except Exception as e:
         result.update({
             "status_code": 0,
             "elapsed_ms": 0.0,
             "success": False,
-            "error": f"Probe failed: {str(e)}"
+            "error": f"Probe failed: {str(e)}",
+            "error_kind": "exception",
         })
+    finally:
+        probes_in_flight.dec()
+    result["finished_at"] = result["timestamp"] = time.time()
+    probe_duration.observe(result["finished_at"] - result["started_at"])
 
+    stats["done"] += 1
+    if result.get("success"):
+        probes_total.inc((job_type, "true"))
+    else:
+        stats["failed"] += 1
+        probes_total.inc((job_type, "false"))
+        if not result.get("error_kind"):
+            result["error_kind"] = "http_status" if result.get("status_code") else "other"
+        probe_errors.inc((job_type, result["error_kind"]))
     producer.send("http_test_results", result)
     print(f"Finished {job_type.upper()} test for {result['url']} - Success: {result['success']}")
+
+
+async def probe_runner(queue, producer, tracker):
+    while True:
+        group = await queue.get()
+        try:
+            # Jobs in a group share a host, so running them in sequence lets
+            # each one reuse the previous one's connection, DNS entry and TLS session
+            for job in group:
+                # A cancelled job never sent its result, so it is left
+                # pending and its offset is not committed past
+                try:
+                    await run_job(job, producer)
+                except Exception as e:
+                    print("Error running job:", e)
+                tracker.done(job)
+        finally:
+            queue.task_done()
+
+
+def group_by_host(jobs):
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job_host(job), []).append(job)
+    for jobs in groups.values():
+        for i in range(0, len(jobs), MAX_GROUP_SIZE):
+            yield jobs[i:i + MAX_GROUP_SIZE]
+
+
+async def dispatch(jobs, queue):
+    for group in group_by_host(jobs):
+        # Blocks once CONCURRENCY groups are queued, which stops polling
+        # until the runners catch up.
+        await queue.put(group)
+
+
+async def release_loop(limiter, queue):
+    while True:
+        await limiter.wait_due()
+        await dispatch(limiter.release_due(), queue)
+
+
+def poll(consumer, pause_all, throttled):
+    # Partitions assigned in a rebalance start out unpaused, so the paused
+    # set is reapplied on every poll rather than once
+    assignment = consumer.assignment()
+    pause = set(assignment) if pause_all else throttled & assignment
+    resume = consumer.paused() - pause
+    if resume:
+        consumer.resume(*resume)
+    if pause:
+        consumer.pause(*pause)
+    batch = consumer.poll(timeout_ms=POLL_TIMEOUT_MS, max_records=POLL_BATCH)
+    return batch, {tp: consumer.position(tp) for tp in batch}
+
+
+async def poll_loop(consumer, queue, executor, limiter, tracker):
+    loop = asyncio.get_running_loop()
+    host_partitions = {}  # host -> partition its jobs arrive on
+    while True:
+        # Jobs are keyed by host, so a host over its delayed-job cap is held
+        # back by pausing just its partition; hosts on other partitions keep
+        # flowing. Paused partitions fetch nothing, but polling goes on so the
+        # consumer stays within max_poll_interval_ms and keeps its group.
+        throttled = {host_partitions[host] for host in limiter.throttled_hosts() if host in host_partitions}
+        pause_all = limiter.delayed >= limiter.max_delayed
+        # KafkaConsumer is blocking and not thread-safe, so every call to it
+        # goes through the same single-thread executor.
+        batch, positions = await loop.run_in_executor(executor, poll, consumer, pause_all, throttled)
+        if len(host_partitions) >= MAX_TRACKED_HOSTS:
+            host_partitions = {host: host_partitions[host] for host in limiter.throttled_hosts()
+                               if host in host_partitions}
+        for tp, records in batch.items():
+            tracker.track(tp, records, positions[tp])
+        jobs = []
+        now = time.time()
+        for tp, records in batch.items():
+            for msg in records:
+                job = msg.value
+                jobs.append(job)
+                host_partitions[job_host(job)] = tp
+                job["picked_at"] = now
+                if job.get("enqueued_at"):
+                    queue_wait.observe(now - job["enqueued_at"])
+        await dispatch(limiter.admit(jobs), queue)
+
+
+def commit_owned(consumer, offsets):
+    # Partitions lost in a rebalance are someone else's to commit now
+    owned = consumer.assignment()
+    commit(consumer, {tp: offset for tp, offset in offsets.items() if tp in owned})
+    return owned
+
+
+async def commit_offsets(consumer, producer, executor, tracker):
+    offsets = tracker.committable()
+    if not offsets:
+        return
+    loop = asyncio.get_running_loop()
+    # Every job below these offsets has sent its result; flush so those
+    # results are delivered before the jobs count as consumed
+    await loop.run_in_executor(None, producer.flush)
+    owned = await loop.run_in_executor(executor, commit_owned, consumer, offsets)
+    tracker.mark_committed(offsets)
+    tracker.forget(tp for tp in offsets if tp not in owned)
+
+
+async def commit_loop(consumer, producer, executor, tracker):
+    while True:
+        await asyncio.sleep(COMMIT_INTERVAL_MS / 1000)
+        try:
+            await commit_offsets(consumer, producer, executor, tracker)
+        except Exception as e:
+            print("Error committing offsets:", e)
+
+
+def consumer_lag(consumer):
+    lag = {}
+    for tp in consumer.assignment():
+        highwater = consumer.highwater(tp)
+        if highwater is not None:
+            lag[f"{tp.topic}:{tp.partition}"] = max(highwater - consumer.position(tp), 0)
+    return lag
+
+
+async def report_stats(consumer, executor, stats_queue, worker_id):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        lag = await loop.run_in_executor(executor, consumer_lag, consumer)
+        consumer_lag_jobs.set_all({tuple(key.rsplit(":", 1)): value for key, value in lag.items()})
+        if stats_queue is not None:
+            stats_queue.put({
+                "worker": worker_id, "pid": os.getpid(), "time": time.time(), "lag": lag,
+                "metrics": metrics.snapshot(), **stats
+            })
+
+
+async def main(stats_queue=None, worker_id=0):
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kafka-consumer")
+    # Offsets are committed by commit_loop, only past jobs that have finished
+    consumer = get_consumer("http_test_requests", "http-test-worker", enable_auto_commit=False)
+    producer = get_producer()
+    queue = asyncio.Queue(maxsize=CONCURRENCY)
+    limiter = RateLimiter()
+    tracker = OffsetTracker()
+    jobs_pending.fn = lambda: {(): tracker.in_flight}
+    jobs_delayed.fn = lambda: {(): limiter.delayed}
+
+    runners = [asyncio.create_task(probe_runner(queue, producer, tracker)) for _ in range(CONCURRENCY)]
+    runners.append(asyncio.create_task(release_loop(limiter, queue)))
+    runners.append(asyncio.create_task(commit_loop(consumer, producer, executor, tracker)))
+    if stats_queue is not None or METRICS_PORT:
+        runners.append(asyncio.create_task(report_stats(consumer, executor, stats_queue, worker_id)))
+    if stats_queue is None and METRICS_PORT:
+        start_http_server(METRICS_PORT, metrics.render)
+    print(f"Worker {worker_id} started with concurrency {CONCURRENCY}...")
+
+    try:
+        await poll_loop(consumer, queue, executor, limiter, tracker)
+    finally:
+        for task in runners:
+            task.cancel()
+        await asyncio.gather(*runners, return_exceptions=True)
+        for probe in probe_map.values():
+            await probe.close()
+        try:
+            await commit_offsets(consumer, producer, executor, tracker)
+        except Exception as e:
+            print("Error committing offsets:", e)
+        producer.flush()
+        consumer.close(autocommit=False)
+        executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+"""Compare the wire codec with plain JSON: bytes per message, encode/decode time,
+and batch size under the compression codecs Kafka can use.
+
+Run from the trace directory:
+
+    python -m bench.codec --messages 20000 --out codec_results.json
+"""
+import os
+import sys
+import json
+import zlib
+import time
+import argparse
+
+TRACE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_JOB = {
+    "url": "https://www.example.com/health",
+    "method": "GET",
+    "type": "https",
+    "read_body": False,
+    "max_body_bytes": None,
+    "bypass_dns_cache": False,
+    "rate_limit": None,
+    "rate_burst": None,
+}
+
+SAMPLE_RESULT = {
+    "url": "https://www.example.com/health",
+    "method": "GET",
+    "type": "https",
+    "status_code": 200,
+    "elapsed_ms": 84.21734,
+    "success": True,
+    "error": None,
+    "dns_ok": True,
+    "tcp_ok": True,
+    "ssl_ok": True,
+    "send_ok": True,
+    "recv_ok": True,
+    "protocol": "https",
+    "ssl_cert_error": None,
+    "tls_resumed": True,
+    "dns_ms": 0.0121,
+    "connect_ms": 12.4893,
+    "tls_ms": 21.0042,
+    "ttfb_ms": 50.7112,
+    "total_ms": 84.21734,
+    "body_ms": None,
+    "body_bytes": 0,
+    "body_truncated": None,
+}
+
+
+def compressors():
+    found = {"none": lambda b: b, "gzip": lambda b: zlib.compress(b, 6)}
+    try:
+        import lz4.frame
+        found["lz4"] = lz4.frame.compress
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        found["zstd"] = zstandard.ZstdCompressor().compress
+    except ImportError:
+        pass
+    return found
+
+
+def vary(sample, i):
+    # Realistic spread: different URLs and timings, so compression has to work for it
+    message = dict(sample, url=f"https://host{i % 500}.example.com/path/{i % 37}")
+    for key in ("elapsed_ms", "connect_ms", "tls_ms", "ttfb_ms", "total_ms"):
+        if message.get(key) is not None:
+            message[key] = message[key] * (1 + (i % 100) / 100)
+    return message
+
+
+def measure(name, encode, decode, messages, batch_size):
+    start = time.perf_counter()
+    encoded = [encode(m) for m in messages]
+    encode_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for data in encoded:
+        decode(data)
+    decode_s = time.perf_counter() - start
+
+    # Kafka compresses whole record batches, so compare on batches, not single messages
+    batches = [b"".join(encoded[i:i + batch_size]) for i in range(0, len(encoded), batch_size)]
+    compressed = {
+        label: sum(len(compress(b)) for b in batches) / len(encoded)
+        for label, compress in compressors().items()
+    }
+    return {
+        "codec": name,
+        "bytes_per_message": compressed["none"],
+        "compressed_bytes_per_message": compressed,
+        "encode_us": encode_s * 1e6 / len(messages),
+        "decode_us": decode_s * 1e6 / len(messages),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=500, help="messages per simulated Kafka batch")
+    parser.add_argument("--out", default="codec_results.json")
+    args = parser.parse_args()
+
+    sys.path.insert(0, TRACE_DIR)
+    from shared import codec
+
+    codecs = [(
+        "json",
+        lambda v: json.dumps(v).encode("utf-8"),
+        lambda b: json.loads(b.decode("utf-8")),
+    )]
+    if codec.msgpack is not None:
+        codecs.append(("msgpack", codec.encode, codec.decode))
+    else:
+        print("msgpack is not installed; only JSON is measured", file=sys.stderr)
+
+    report = {"config": vars(args), "time": time.time(), "python": sys.version.split()[0]}
+    for kind, sample in (("job", SAMPLE_JOB), ("result", SAMPLE_RESULT)):
+        messages = [vary(sample, i) for i in range(args.messages)]
+        report[kind] = [measure(name, enc, dec, messages, args.batch_size) for name, enc, dec in codecs]
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""End-to-end benchmark: jobs in, worker, results out, over the in-memory transport.
+
+Run from the trace directory:
+
+    python -m bench.pipeline --jobs 5000 --latency-ms 20 --out bench_results.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import contextlib
+import statistics
+import multiprocessing as mp
+from urllib.parse import urlsplit
+
+TRACE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def request_target(url):
+    parts = urlsplit(url)
+    return f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+
+def load_server_times(path):
+    times = {}
+    with open(path) as f:
+        for line in f:
+            target, ms = line.split()
+            times[target] = float(ms)
+    return times
+
+
+async def drive(args, urls, server_log):
+    # Imported here so the transport and worker settings set in main() apply
+    import worker
+    from shared.transport import get_producer, get_consumer
+
+    producer = get_producer()
+    results_consumer = get_consumer("http_test_results", "bench", auto_offset_reset="latest")
+    loop = asyncio.get_running_loop()
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for i in range(args.jobs):
+        url, job_type = urls[i % len(urls)]
+        # A distinct target per job, to match each result with the server's own timing
+        producer.send("http_test_requests", {"url": f"{url}?job={i}", "type": job_type, "method": "GET"})
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        worker_task = asyncio.create_task(worker.main())
+        results = []
+        deadline = time.monotonic() + args.timeout
+        while len(results) < args.jobs and time.monotonic() < deadline:
+            batch = await loop.run_in_executor(None, lambda: results_consumer.poll(timeout_ms=200))
+            for records in batch.values():
+                results.extend(msg.value for msg in records)
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        worker_task.cancel()
+        await asyncio.gather(worker_task, return_exceptions=True)
+
+    ok = [r for r in results if r.get("success")]
+    # Subtract what the server measured, so its jitter doesn't count as overhead
+    server_ms = load_server_times(server_log)
+    overhead = [r["elapsed_ms"] - server_ms[request_target(r["url"])] for r in ok
+                if request_target(r["url"]) in server_ms]
+    errors = {}
+    for r in results:
+        if r.get("error"):
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+
+    return {
+        "completed": len(results),
+        "succeeded": len(ok),
+        "wall_s": wall,
+        "probes_per_sec": len(results) / wall if wall else None,
+        "overhead_ms": {
+            "samples": len(overhead),
+            "mean": statistics.fmean(overhead) if overhead else None,
+            "p50": percentile(overhead, 0.5),
+            "p95": percentile(overhead, 0.95),
+            "p99": percentile(overhead, 0.99),
+        },
+        "cpu_ms_per_probe": cpu * 1000 / len(results) if results else None,
+        "rss_mb": rss_mb(),
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "errors": dict(sorted(errors.items(), key=lambda e: -e[1])[:10]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=20, help="artificial latency added by the targets")
+    parser.add_argument("--protocol", choices=["http", "https", "both"], default="both")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=300, help="give up after this many seconds")
+    parser.add_argument("--out", default="bench_results.json")
+    args = parser.parse_args()
+
+    # Configure the pipeline before anything imports it
+    os.environ["TRACE_TRANSPORT"] = "memory"
+    os.environ["WORKER_CONCURRENCY"] = str(args.concurrency)
+    os.environ.setdefault("RATE_LIMIT_PER_HOST", "0")
+    os.environ.setdefault("WORKER_STATS_INTERVAL", "3600")
+    os.environ.setdefault("AGENT_METRICS_PORT", "0")
+    sys.path[:0] = [os.path.join(TRACE_DIR, "agent"), TRACE_DIR]
+
+    from bench.targets import make_self_signed_cert, run_targets
+
+    http_port, https_port = free_port(), free_port()
+    urls = []
+    if args.protocol in ("http", "both"):
+        urls.append((f"http://127.0.0.1:{http_port}/", "http"))
+    if args.protocol in ("https", "both"):
+        urls.append((f"https://127.0.0.1:{https_port}/", "https"))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = make_self_signed_cert(tmp)
+        server_log = os.path.join(tmp, "server_times.log")
+        targets = mp.get_context("spawn").Process(
+            target=run_targets, args=(http_port, https_port, args.latency_ms, cert, key, server_log), daemon=True
+        )
+        targets.start()
+        time.sleep(1)
+        try:
+            report = asyncio.run(drive(args, urls, server_log))
+        finally:
+            targets.terminate()
+            targets.join()
+
+    report = {
+        "config": vars(args),
+        "time": time.time(),
+        "python": sys.version.split()[0],
+        **report,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import os
+import ssl
+import time
+import asyncio
+import tempfile
+import subprocess
+
+RESPONSE_BODY = b"ok"
+
+
+def make_self_signed_cert(directory):
+    """Create a throwaway localhost certificate with the openssl CLI."""
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-keyout", key, "-out", cert],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+async def handle(reader, writer, latency, log):
+    # Minimal HTTP/1.1 server: keep-alive, no request bodies
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            received = time.perf_counter()
+            await asyncio.sleep(latency)
+            close = b"connection: close" in head.lower()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n"
+                + f"Content-Length: {len(RESPONSE_BODY)}\r\n".encode()
+                + (b"Connection: close\r\n" if close else b"")
+                + b"\r\n" + RESPONSE_BODY
+            )
+            await writer.drain()
+            if log:
+                # Request target and the time spent here, so the benchmark can
+                # subtract what the server actually took rather than latency
+                target = head.split(b" ", 2)[1].decode()
+                log.write(f"{target} {(time.perf_counter() - received) * 1000}\n")
+            if close:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(http_port, https_port, latency_ms, cert=None, key=None, log=None):
+    latency = latency_ms / 1000
+    servers = [await asyncio.start_server(lambda r, w: handle(r, w, latency, log), "127.0.0.1", http_port)]
+    if https_port:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        servers.append(await asyncio.start_server(
+            lambda r, w: handle(r, w, latency, log), "127.0.0.1", https_port, ssl=context
+        ))
+    await asyncio.gather(*(s.serve_forever() for s in servers))
+
+
+def run_targets(http_port, https_port, latency_ms, cert=None, key=None, log_path=None):
+    """Process entry point, so the targets don't share CPU time with the worker.
+
+    With log_path, every response appends "<request target> <ms spent>" to it.
+    """
+    log = open(log_path, "a", buffering=1) if log_path else None
+    asyncio.run(serve(http_port, https_port, latency_ms, cert, key, log))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Local HTTP/HTTPS targets with artificial latency")
+    parser.add_argument("--http-port", type=int, default=8080)
+    parser.add_argument("--https-port", type=int, default=8443)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = make_self_signed_cert(tmp)
+        run_targets(args.http_port, args.https_port, args.latency_ms, cert, key)
@@ -0,0 +1,68 @@
+import time
+import uuid
+from threading import Lock
+from collections import OrderedDict
+
+MAX_TRACKED_BATCHES = 1000
+
+
+class BatchTracker:
+    """Per-batch progress counters, updated by the result listener thread."""
+
+    def __init__(self, max_batches=MAX_TRACKED_BATCHES):
+        self.max_batches = max_batches
+        self._batches = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def _new(batch_id, submitted):
+        return {
+            "batch_id": batch_id,
+            "created_at": time.time(),
+            "submitted": submitted,
+            "completed": 0,
+            "succeeded": 0,
+            "failed": 0,
+        }
+
+    def create(self) -> str:
+        batch_id = uuid.uuid4().hex
+        with self._lock:
+            self._batches[batch_id] = self._new(batch_id, submitted=0)
+            while len(self._batches) > self.max_batches:
+                self._batches.popitem(last=False)
+        return batch_id
+
+    def add_submitted(self, batch_id, count):
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch:
+                batch["submitted"] += count
+
+    def record(self, result: dict):
+        batch_id = result.get("batch_id")
+        if not batch_id:
+            return
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                # Submitted through another replica: progress is tracked here
+                # too, but only that replica knows how many jobs were submitted
+                batch = self._batches[batch_id] = self._new(batch_id, submitted=None)
+                while len(self._batches) > self.max_batches:
+                    self._batches.popitem(last=False)
+            batch["completed"] += 1
+            batch["succeeded" if result.get("success") else "failed"] += 1
+
+    def get(self, batch_id):
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            return dict(batch) if batch else None
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [dict(batch) for batch in self._batches.values()]
+
+    def restore(self, state: list):
+        with self._lock:
+            self._batches = OrderedDict((batch["batch_id"], batch) for batch in state[-self.max_batches:])
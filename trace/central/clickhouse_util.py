@@ -0,0 +1,341 @@
+import os
+import json
+import time
+import glob
+import uuid
+import urllib.request
+import urllib.parse
+from threading import Thread, Lock, Event
+
+# Writer is disabled unless CLICKHOUSE_URL is set, e.g. http://localhost:8123
+CLICKHOUSE_URL = os.environ.get("CLICKHOUSE_URL")
+CLICKHOUSE_DATABASE = os.environ.get("CLICKHOUSE_DATABASE", "default")
+CLICKHOUSE_USER = os.environ.get("CLICKHOUSE_USER")
+CLICKHOUSE_PASSWORD = os.environ.get("CLICKHOUSE_PASSWORD")
+RESULTS_TABLE = "probe_results"
+
+FLUSH_ROWS = int(os.environ.get("CLICKHOUSE_FLUSH_ROWS", "5000"))
+FLUSH_INTERVAL = float(os.environ.get("CLICKHOUSE_FLUSH_INTERVAL", "5"))
+MAX_RETRIES = 5
+INITIAL_BACKOFF = 0.5
+MAX_BACKOFF = 30
+SPILL_DIR = os.environ.get("CLICKHOUSE_SPILL_DIR", "clickhouse_spill")
+# Spilled batches kept on disk; the oldest are dropped beyond this
+SPILL_MAX_BYTES = int(os.environ.get("CLICKHOUSE_SPILL_MAX_BYTES", str(1024 ** 3)))
+REQUEST_TIMEOUT = 30
+
+# Column -> (ClickHouse type, key in the TestResult dict)
+COLUMNS = {
+    "timestamp": ("DateTime64(3)", "timestamp"),
+    "url": ("LowCardinality(String)", "url"),
+    "method": ("LowCardinality(String)", "method"),
+    "protocol": ("LowCardinality(String)", "protocol"),
+    "status_code": ("UInt16", "status_code"),
+    "success": ("Bool", "success"),
+    "elapsed_ms": ("Float64", "elapsed_ms"),
+    "dns_ms": ("Nullable(Float64)", "dns_ms"),
+    "connect_ms": ("Nullable(Float64)", "connect_ms"),
+    "tls_ms": ("Nullable(Float64)", "tls_ms"),
+    "ttfb_ms": ("Nullable(Float64)", "ttfb_ms"),
+    "error": ("Nullable(String)", "error"),
+    "batch_id": ("Nullable(String)", "batch_id"),
+}
+
+CREATE_RESULTS_TABLE = f"""
+CREATE TABLE IF NOT EXISTS {RESULTS_TABLE} (
+    {", ".join(f"{name} {ch_type}" for name, (ch_type, _) in COLUMNS.items())}
+) ENGINE = MergeTree
+PARTITION BY toYYYYMM(timestamp)
+ORDER BY (url, timestamp)
+"""
+
+# Rollups are filled by materialized views as rows are inserted, so history
+# queries never touch probe_results. Latency quantiles cover successful probes
+# only, like /stats, since failures report an elapsed_ms of 0.
+# Granularity in seconds -> (table, bucket function)
+ROLLUPS = {
+    86400: ("probe_rollup_1d", "toStartOfDay"),
+    3600: ("probe_rollup_1h", "toStartOfHour"),
+    60: ("probe_rollup_1m", "toStartOfMinute"),
+}
+QUANTILES = (0.5, 0.95, 0.99)
+_QUANTILE_ARGS = ", ".join(str(q) for q in QUANTILES)
+MAX_HISTORY_BUCKETS = 10000
+
+
+def rollup_ddl(table, bucket_fn):
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            url LowCardinality(String),
+            bucket DateTime,
+            count SimpleAggregateFunction(sum, UInt64),
+            successes SimpleAggregateFunction(sum, UInt64),
+            latency AggregateFunction(quantilesTDigest({_QUANTILE_ARGS}), Float64)
+        ) ENGINE = AggregatingMergeTree
+        PARTITION BY toYYYYMM(bucket)
+        ORDER BY (url, bucket)
+        """,
+        f"""
+        DROP VIEW IF EXISTS {table}_mv
+        """,
+        f"""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS {table}_success_mv TO {table} AS
+        SELECT
+            url,
+            {bucket_fn}(timestamp) AS bucket,
+            count() AS count,
+            countIf(success) AS successes,
+            quantilesTDigestStateIf({_QUANTILE_ARGS})(elapsed_ms, success) AS latency
+        FROM {RESULTS_TABLE}
+        GROUP BY url, bucket
+        """,
+    ]
+
+
+def parse_step(step: str) -> int:
+    """Parse a bucket size like "300", "5m", "1h" or "1d" into seconds."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    step = step.strip().lower()
+    if step and step[-1] in units:
+        return int(step[:-1]) * units[step[-1]]
+    return int(step)
+
+
+def default_step(span: float, buckets: int) -> int:
+    """Smallest step giving at most ~buckets buckets, rounded to a rollup granularity."""
+    raw = max(int(-(-span // buckets)), 1)
+    granularity = next((g for g in ROLLUPS if g <= raw), min(ROLLUPS))
+    return int(-(-raw // granularity)) * granularity
+
+
+def query_history(client, url: str, start: float, end: float, step: int) -> list[dict]:
+    """Per-bucket count, success rate and latency percentiles for url.
+
+    Reads from the coarsest rollup whose granularity divides step.
+    """
+    if step <= 0:
+        raise ValueError("step must be positive")
+    if start >= end:
+        raise ValueError("from must be before to")
+    granularity = next((g for g in ROLLUPS if step % g == 0), None)
+    if granularity is None:
+        raise ValueError(f"step must be a multiple of {min(ROLLUPS)} seconds")
+    if (end - start) / step > MAX_HISTORY_BUCKETS:
+        raise ValueError(f"range and step give more than {MAX_HISTORY_BUCKETS} buckets")
+
+    table, _ = ROLLUPS[granularity]
+    query = f"""
+        SELECT
+            toUnixTimestamp(toStartOfInterval(bucket, INTERVAL {{step:UInt32}} SECOND)) AS t,
+            sum(count) AS count,
+            sum(successes) AS successes,
+            quantilesTDigestMerge({_QUANTILE_ARGS})(latency) AS latency
+        FROM {table}
+        WHERE url = {{url:String}}
+          AND bucket >= toDateTime({{start:UInt32}})
+          AND bucket < toDateTime({{end:UInt32}})
+        GROUP BY t
+        ORDER BY t
+        FORMAT JSONEachRow
+    """
+    body = client.execute(query, params={"url": url, "start": int(start), "end": int(end), "step": step})
+
+    buckets = []
+    for line in body.splitlines():
+        row = json.loads(line)
+        count = int(row["count"])
+        buckets.append({
+            "t": int(row["t"]),
+            "count": count,
+            "success_rate": int(row["successes"]) / count if count else None,
+            **{f"p{int(q * 100)}": v for q, v in zip(QUANTILES, row["latency"])},
+        })
+    return buckets
+
+
+class ClickHouseClient:
+    """Minimal client for the ClickHouse HTTP interface."""
+
+    def __init__(self, url=CLICKHOUSE_URL, database=CLICKHOUSE_DATABASE,
+                 user=CLICKHOUSE_USER, password=CLICKHOUSE_PASSWORD):
+        self.url = url.rstrip("/")
+        self.database = database
+        self.headers = {}
+        if user:
+            self.headers["X-ClickHouse-User"] = user
+        if password:
+            self.headers["X-ClickHouse-Key"] = password
+
+    def execute(self, query: str, data: bytes | None = None, params: dict | None = None) -> bytes:
+        """Run a query. With data, query is the INSERT prefix and data the rows.
+
+        params are bound to {name:Type} placeholders in the query.
+        """
+        args = {"database": self.database}
+        for name, value in (params or {}).items():
+            args[f"param_{name}"] = value
+        if data is None:
+            body = query.encode()
+        else:
+            args["query"] = query
+            body = data
+        req = urllib.request.Request(
+            f"{self.url}/?{urllib.parse.urlencode(args)}", data=body, headers=self.headers, method="POST"
+        )
+        with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as resp:
+            return resp.read()
+
+
+def to_row(result: dict) -> dict:
+    row = {name: result.get(key) for name, (_, key) in COLUMNS.items()}
+    row["timestamp"] = row["timestamp"] or time.time()
+    row["method"] = row["method"] or "GET"
+    row["protocol"] = row["protocol"] or ""
+    row["status_code"] = row["status_code"] or 0
+    row["success"] = bool(row["success"])
+    row["elapsed_ms"] = row["elapsed_ms"] or 0.0
+    return row
+
+
+class ClickHouseWriter:
+    """Buffers results and inserts them into ClickHouse in batches.
+
+    A batch is flushed once it holds flush_rows rows or is flush_interval
+    seconds old, as one JSONEachRow insert. Failed inserts are retried with
+    exponential backoff; if ClickHouse stays unreachable the batch is spilled
+    to spill_dir and replayed after the next successful insert. The spill
+    directory is capped at spill_max_bytes by dropping the oldest batches.
+    """
+
+    def __init__(self, client: ClickHouseClient, flush_rows=FLUSH_ROWS,
+                 flush_interval=FLUSH_INTERVAL, spill_dir=SPILL_DIR, spill_max_bytes=SPILL_MAX_BYTES,
+                 retries=MAX_RETRIES, backoff=INITIAL_BACKOFF):
+        self.client = client
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self.retries = retries
+        self.backoff = backoff
+        self._buffer = []
+        self._lock = Lock()
+        # Held for a whole flush, so batches land (and persisted advances) in order
+        self._flush_lock = Lock()
+        self._wakeup = Event()
+        self._stopped = Event()
+        self._thread = None
+        self._ready = False
+        self.rows_written = 0
+        self.rows_spilled = 0
+        self.rows_dropped = 0
+        # Rows passed to add(), and how many of the first of those are in
+        # ClickHouse or spilled to disk; callers commit source offsets up to it
+        self.added = 0
+        self.persisted = 0
+
+    def start(self):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self._setup()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _setup(self):
+        try:
+            self.client.execute(CREATE_RESULTS_TABLE)
+            for table, bucket_fn in ROLLUPS.values():
+                for ddl in rollup_ddl(table, bucket_fn):
+                    self.client.execute(ddl)
+            self._ready = True
+        except Exception as e:
+            print("Could not create ClickHouse tables, will retry on flush:", e)
+
+    def add(self, result: dict):
+        row = to_row(result)
+        with self._lock:
+            self._buffer.append(row)
+            self.added += 1
+            full = len(self._buffer) >= self.flush_rows
+        if full:
+            self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(REQUEST_TIMEOUT)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+                added = self.added
+            if not rows:
+                return
+            data = "\n".join(json.dumps(row) for row in rows).encode()
+            if not self._ready:
+                self._setup()
+            if self._ready and self._insert(data):
+                self.rows_written += len(rows)
+                self.persisted = added
+                self._replay_spilled()
+            elif self._spill(data):
+                self.rows_spilled += len(rows)
+                self.persisted = added
+
+    def _insert(self, data: bytes) -> bool:
+        delay = self.backoff
+        for attempt in range(self.retries):
+            try:
+                self.client.execute(f"INSERT INTO {RESULTS_TABLE} FORMAT JSONEachRow", data)
+                return True
+            except Exception as e:
+                print(f"ClickHouse insert failed (attempt {attempt + 1}/{self.retries}):", e)
+                if attempt + 1 == self.retries or self._stopped.wait(delay):
+                    return False
+                delay = min(delay * 2, MAX_BACKOFF)
+        return False
+
+    def _make_room(self, size: int):
+        files = sorted(glob.glob(os.path.join(self.spill_dir, "*.ndjson")))
+        total = sum(os.path.getsize(path) for path in files)
+        while files and total + size > self.spill_max_bytes:
+            oldest = files.pop(0)
+            with open(oldest, "rb") as f:
+                dropped = len(f.read().splitlines())
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            self.rows_dropped += dropped
+            print(f"Spill directory full, dropped {dropped} rows from {oldest}")
+        return total + size <= self.spill_max_bytes
+
+    def _spill(self, data: bytes):
+        if not self._make_room(len(data)):
+            self.rows_dropped += len(data.splitlines())
+            print(f"Batch of {len(data)} bytes exceeds the spill limit, dropped it")
+            return False
+        path = os.path.join(self.spill_dir, f"{time.time():.6f}-{uuid.uuid4().hex}.ndjson")
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        print(f"Spilled {len(data.splitlines())} rows to {path}")
+        return True
+
+    def _replay_spilled(self):
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, "*.ndjson"))):
+            with open(path, "rb") as f:
+                data = f.read()
+            try:
+                self.client.execute(f"INSERT INTO {RESULTS_TABLE} FORMAT JSONEachRow", data)
+            except Exception as e:
+                print("Replaying spilled rows failed, will retry later:", e)
+                return
+            os.remove(path)
+            self.rows_written += len(data.splitlines())
@@ -0,0 +1,112 @@
+import os
+import time
+import asyncio
+from shared.transport import get_producer, job_host
+
+# Jobs accepted but not yet handed to the producer; beyond this submit() refuses
+MAX_PENDING = int(os.environ.get("PRODUCER_MAX_PENDING", "10000"))
+LINGER_MS = int(os.environ.get("PRODUCER_LINGER_MS", "20"))
+BATCH_SIZE = int(os.environ.get("PRODUCER_BATCH_SIZE", str(256 * 1024)))
+# lz4, gzip or none; unset falls back to KAFKA_COMPRESSION
+COMPRESSION = os.environ.get("PRODUCER_COMPRESSION") or None
+# Max jobs handed to the producer per executor call
+SEND_CHUNK = 1000
+SHUTDOWN_TIMEOUT = 10
+
+
+class JobQueue:
+    """Bounded queue in front of a single long-lived KafkaProducer.
+
+    Endpoints call submit() without blocking; a background task drains the
+    queue and sends to Kafka from a thread, since KafkaProducer.send can block
+    when its buffer is full.
+    """
+
+    def __init__(self, topic, max_pending=MAX_PENDING):
+        self.topic = topic
+        self.max_pending = max_pending
+        self.pending = 0
+        # Jobs the producer failed to deliver after they were accepted. Bumped
+        # from the producer's I/O thread; a lost increment only skews a metric.
+        self.send_failures = 0
+        self._queue = asyncio.Queue()
+        self._room = asyncio.Event()
+        self._producer = None
+        self._task = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._producer = await loop.run_in_executor(None, lambda: get_producer(
+            linger_ms=LINGER_MS,
+            batch_size=BATCH_SIZE,
+            compression_type=COMPRESSION,
+        ))
+        self._task = asyncio.create_task(self._drain())
+
+    def submit(self, jobs: list[dict]) -> bool:
+        """Queue jobs for sending; returns False if there is no room for all of them."""
+        if self.pending + len(jobs) > self.max_pending:
+            return False
+        now = time.time()
+        for job in jobs:
+            job.setdefault("enqueued_at", now)
+        self.pending += len(jobs)
+        self._queue.put_nowait(jobs)
+        return True
+
+    async def put(self, jobs: list[dict], timeout: float) -> bool:
+        """Like submit(), but waits up to timeout seconds for room in the queue."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not self.submit(jobs):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            self._room.clear()
+            try:
+                await asyncio.wait_for(self._room.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = list(await self._queue.get())
+            while len(batch) < SEND_CHUNK and not self._queue.empty():
+                batch.extend(self._queue.get_nowait())
+            try:
+                await loop.run_in_executor(None, self._send, batch)
+            except Exception as e:
+                print("Error producing jobs:", e)
+            finally:
+                self.pending -= len(batch)
+                self._room.set()
+
+    def _send(self, jobs):
+        for job in jobs:
+            host = job_host(job)
+            try:
+                future = self._producer.send(self.topic, job, key=host)
+            except Exception as e:
+                self._send_failed(host, e)
+                continue
+            # Kafka delivers in the background and reports through the
+            # future; the local transports write synchronously and return None
+            if future is not None:
+                future.add_errback(lambda e, host=host: self._send_failed(host, e))
+
+    def _send_failed(self, host, error):
+        self.send_failures += 1
+        print(f"Error producing job for {host}:", error)
+
+    async def stop(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SHUTDOWN_TIMEOUT
+        while self.pending and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task:
+            self._task.cancel()
+        if self._producer:
+            await loop.run_in_executor(None, self._producer.flush, SHUTDOWN_TIMEOUT)
+            await loop.run_in_executor(None, self._producer.close, SHUTDOWN_TIMEOUT)
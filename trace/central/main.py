@@ -1,47 +1,309 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
-from threading import Thread
-from shared.kafka_util import get_producer, get_consumer
-from shared.schemas import TestRequest, TestResult
-import json, time
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from threading import Thread, Event
+from shared.transport import get_consumer, commit, lookback_offsets
+from central.job_queue import JobQueue
+from central.batches import BatchTracker
+from central.result_store import ResultStore
+from central.stats import StatsStore
+from central.stream import ResultBroadcaster
+from central.scheduler import Scheduler
+from central.snapshot import Snapshotter
+from central.clickhouse_util import CLICKHOUSE_URL, ClickHouseClient, ClickHouseWriter, parse_step, default_step, query_history
+from shared.schemas import TestRequest, TestResult, ScheduledTarget
+from shared.metrics import Registry, CONTENT_TYPE
+from pydantic import TypeAdapter, ValidationError
+from collections import deque
+import asyncio, json, os, socket, time
+
+# Jobs handed to the producer per queue entry for batch submissions
+BATCH_CHUNK = 5000
+# How long a batch submission waits for room in the producer queue
+BATCH_ENQUEUE_TIMEOUT = 30
+# Bucket count targeted by /results/history when no step is given
+HISTORY_DEFAULT_BUCKETS = 300
+# How long shutdown waits for the listener's final snapshot
+LISTENER_STOP_TIMEOUT = 30
+# Every replica consumes every result through its own consumer group, so each
+# one serves complete /results, /stats and streams. The id must be stable
+# across restarts for the group's committed offsets to be reused.
+REPLICA_ID = os.environ.get("CENTRAL_REPLICA_ID") or socket.gethostname()
+# Results per partition replayed into the stores when a replica starts
+# without a snapshot (e.g. a new pod), so it doesn't serve empty stores
+RESULT_LOOKBACK = int(os.environ.get("CENTRAL_RESULT_LOOKBACK", "10000"))
+# Set to 1 on exactly one designated replica: every replica that runs the
+# scheduler probes every target. Targets live in that replica's
+# SCHEDULER_TARGETS_FILE, so /targets must be routed to it; the other
+# replicas answer /targets with 503.
+RUN_SCHEDULER = os.environ.get("CENTRAL_RUN_SCHEDULER", "0") == "1"
 
 app = FastAPI()
 
-result_cache = []
+result_store = ResultStore()
+stats_store = StatsStore()
+broadcaster = ResultBroadcaster()
+job_queue = JobQueue("http_test_requests")
+batches = BatchTracker()
+scheduler = Scheduler(job_queue) if RUN_SCHEDULER else None
+clickhouse = ClickHouseWriter(ClickHouseClient()) if CLICKHOUSE_URL else None
+snapshotter = Snapshotter({"results": result_store, "stats": stats_store, "batches": batches})
+request_list = TypeAdapter(list[TestRequest])
+listener_stop = Event()
+
+# Where a result's time goes between acceptance and ingestion. The stages
+# span hosts, so they are only as accurate as the hosts' clocks.
+metrics = Registry()
+PIPELINE_STAGES = (
+    ("trace_job_queue_wait_seconds", "enqueued_at", "picked_at",
+     "Time from central accepting a job to a worker polling it"),
+    ("trace_job_worker_wait_seconds", "picked_at", "started_at",
+     "Time from a worker polling a job to starting its probe"),
+    ("trace_probe_duration_seconds", "started_at", "finished_at",
+     "Time from starting a probe to its result being ready"),
+    ("trace_result_ingest_lag_seconds", "finished_at", "ingested_at",
+     "Time from a result being ready to central receiving it"),
+    ("trace_pipeline_latency_seconds", "enqueued_at", "ingested_at",
+     "Time from central accepting a job to receiving its result"),
+)
+stage_histograms = [
+    (metrics.histogram(name, help), start, end) for name, start, end, help in PIPELINE_STAGES
+]
+metrics.counter("trace_job_send_failures_total", "Accepted jobs the producer failed to deliver",
+                fn=lambda: {(): job_queue.send_failures})
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 @app.post("/probe")
 async def enqueue_test(req: TestRequest):
-    producer = get_producer()
-    producer.send("http_test_requests", json.loads(req.json()))
+    if not job_queue.submit([json.loads(req.json())]):
+        raise HTTPException(status_code=429, detail="Probe queue is full, retry later")
     return {"queued": True}
 
+@app.post("/probe/batch")
+async def enqueue_batch(request: Request):
+    # Accepts a JSON array of TestRequest objects, or one object per line
+    # with Content-Type: application/x-ndjson
+    body = await request.body()
+    if "ndjson" in request.headers.get("content-type", ""):
+        body = b"[" + b",".join(line for line in body.splitlines() if line.strip()) + b"]"
+    try:
+        reqs = request_list.validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+    batch_id = batches.create()
+    jobs = [dict(r.model_dump(mode="json"), batch_id=batch_id) for r in reqs]
+    queued = 0
+    for i in range(0, len(jobs), BATCH_CHUNK):
+        chunk = jobs[i:i + BATCH_CHUNK]
+        if not await job_queue.put(chunk, BATCH_ENQUEUE_TIMEOUT):
+            raise HTTPException(
+                status_code=429,
+                detail={"error": "Probe queue is full, retry later", "batch_id": batch_id, "queued": queued},
+            )
+        queued += len(chunk)
+        batches.add_submitted(batch_id, len(chunk))
+    return {"batch_id": batch_id, "queued": queued}
+
+@app.get("/probe/batch/{batch_id}")
+async def get_batch(batch_id: str):
+    batch = batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Unknown batch")
+    batch["results"], _ = result_store.query(batch_id=batch_id, limit=100)
+    return batch
+
+def require_scheduler():
+    if scheduler is None:
+        raise HTTPException(status_code=503, detail="Targets are managed by the central replica with CENTRAL_RUN_SCHEDULER=1")
+    return scheduler
+
+@app.post("/targets")
+async def add_target(target: ScheduledTarget):
+    # Probe target.url every target.interval seconds until deleted
+    job = json.loads(target.json(exclude={"interval", "id"}))
+    return require_scheduler().add(job, target.interval, target.id)
+
+@app.get("/targets")
+async def list_targets():
+    return list(require_scheduler().targets.values())
+
+@app.delete("/targets/{target_id}")
+async def delete_target(target_id: str):
+    if not require_scheduler().remove(target_id):
+        raise HTTPException(status_code=404, detail="Unknown target")
+    return {"deleted": True}
+
 @app.get("/results", response_model=list[TestResult])
-async def get_results():
-    return list(reversed(result_cache))[:10]  # return last 10 results (most recent first)
+async def get_results(
+    response: Response,
+    url: str | None = None,
+    protocol: str | None = None,
+    success: bool | None = None,
+    cursor: int | None = None,
+    limit: int = Query(10, ge=1, le=1000),
+):
+    # Most recent first; pass X-Next-Cursor back as cursor for the next page
+    results, next_cursor = result_store.query(
+        url=url, protocol=protocol, success=success, cursor=cursor, limit=limit
+    )
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return results
+
+@app.get("/results/stream")
+async def stream_results(url: str | None = None, protocol: str | None = None):
+    # Server-sent events: each message's data is one result as JSON
+    sub = broadcaster.subscribe(url, protocol)
+
+    async def events():
+        try:
+            async for chunk in broadcaster.events(sub):
+                yield chunk
+        finally:
+            broadcaster.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/results/history")
+def get_history(url: str, start: float | None = Query(None, alias="from"),
+                end: float | None = Query(None, alias="to"), step: str | None = None):
+    # from/to are unix seconds (default: the last 24 hours); step is e.g. "60", "5m", "1h", "1d"
+    if clickhouse is None:
+        raise HTTPException(status_code=503, detail="History requires CLICKHOUSE_URL to be configured")
+    end = end or time.time()
+    start = start or end - 86400
+    try:
+        step_seconds = parse_step(step) if step else default_step(end - start, HISTORY_DEFAULT_BUCKETS)
+        buckets = query_history(clickhouse.client, url, start, end, step_seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"url": url, "from": start, "to": end, "step": step_seconds, "buckets": buckets}
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
+
+@app.get("/stats")
+async def get_stats(url: str | None = None):
+    # Availability and latency percentiles over 1m/15m/1h/24h windows, for url or all URLs
+    summary = stats_store.summary(time.time(), url)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No results for this URL")
+    return {"url": url, "windows": summary}
+
+
+def handle_result(result):
+    result["ingested_at"] = time.time()
+    # Workers stamp results so every replica sees the same time; older ones don't
+    result.setdefault("timestamp", result["ingested_at"])
+    for histogram, start, end in stage_histograms:
+        if result.get(start) and result.get(end):
+            histogram.observe(result[end] - result[start])
+    result_store.add(result)
+    stats_store.add(result)
+    broadcaster.publish(result)
+    batches.record(result)
 
 
 def result_listener():
-    consumer = get_consumer("http_test_results", "result-api")
-    print("Result listener started...")
-    for msg in consumer:
+    # Resume from the snapshot's offsets; with no snapshot the stores start
+    # empty, so refill them from the most recent results
+    offsets = snapshotter.load()
+    if offsets is None and RESULT_LOOKBACK > 0:
         try:
-            result = msg.value
-            result["timestamp"] = time.time()
-            result_cache.append(result)
-            if len(result_cache) > 100:
-                result_cache.pop(0)  # keep memory usage low
+            offsets = lookback_offsets("http_test_results", RESULT_LOOKBACK)
         except Exception as e:
-            print("Error parsing result:", e)
+            print("Could not look up recent results, starting from new ones:", e)
+    consumer = get_consumer(
+        "http_test_results", f"result-api-{REPLICA_ID}", start_offsets=offsets, auto_offset_reset="latest"
+    )
+    print("Result listener started...")
+    while not listener_stop.is_set():
+        for records in consumer.poll(timeout_ms=1000).values():
+            for msg in records:
+                try:
+                    handle_result(msg.value)
+                except Exception as e:
+                    print("Error parsing result:", e)
+        # Between polls every fetched record has been applied, so the
+        # consumer's positions match the stores exactly
+        snapshotter.maybe_save(consumer)
+    snapshotter.save(consumer)
+    consumer.close()
+
 
+def result_writer():
+    # Unlike the listener this group is shared by all replicas, so between
+    # them each result is written to ClickHouse once. Offsets are committed
+    # only once the writer has inserted or spilled every row before them, so
+    # rows still in its buffer are consumed again after a crash.
+    consumer = get_consumer("http_test_results", "result-writer", enable_auto_commit=False)
+    polled = deque()  # (rows added to the writer, {tp: position}) after each poll
 
-# Start Kafka listener thread when app starts
+    def commit_persisted():
+        offsets = {}
+        while polled and polled[0][0] <= clickhouse.persisted:
+            offsets.update(polled.popleft()[1])
+        if offsets:
+            try:
+                commit(consumer, offsets)
+            except Exception as e:
+                print("Error committing result-writer offsets:", e)
+
+    while not listener_stop.is_set():
+        batch = consumer.poll(timeout_ms=1000)
+        for records in batch.values():
+            for msg in records:
+                try:
+                    msg.value.setdefault("timestamp", time.time())
+                    clickhouse.add(msg.value)
+                except Exception as e:
+                    print("Error writing result:", e)
+        if batch:
+            polled.append((clickhouse.added, {tp: consumer.position(tp) for tp in batch}))
+        commit_persisted()
+    clickhouse.flush()
+    commit_persisted()
+    consumer.close()
+
+
+listener = Thread(target=result_listener, daemon=True)
+writer = Thread(target=result_writer, daemon=True)
+
+
+# Start Kafka producer and listener thread when app starts
 @app.on_event("startup")
-def startup_event():
-    Thread(target=result_listener, daemon=True).start()
\ No newline at end of file
+async def startup_event():
+    await job_queue.start()
+    broadcaster.start()
+    if scheduler:
+        scheduler.start()
+    if clickhouse:
+        clickhouse.start()
+        writer.start()
+    listener.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    listener_stop.set()
+    await asyncio.to_thread(listener.join, LISTENER_STOP_TIMEOUT)
+    broadcaster.stop()
+    if scheduler:
+        await scheduler.stop()
+    await job_queue.stop()
+    if clickhouse:
+        await asyncio.to_thread(writer.join, LISTENER_STOP_TIMEOUT)
+        clickhouse.stop()
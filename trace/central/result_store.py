@@ -0,0 +1,117 @@
+import os
+from threading import Lock
+from collections import deque, OrderedDict
+from shared.schemas import TestResult
+
+# A full result costs roughly 800 bytes in memory and 170 bytes in a
+# snapshot, so the defaults (at most 10000 + 100 * 1000 records) come to
+# about 85 MB resident and 20 MB per snapshot. Raising MAX_URLS to 10000
+# takes that to about 750 MB and 170 MB.
+MAX_RESULTS = int(os.environ.get("RESULT_STORE_MAX_RESULTS", "10000"))
+PER_URL_RESULTS = int(os.environ.get("RESULT_STORE_PER_URL", "100"))
+MAX_URLS = int(os.environ.get("RESULT_STORE_MAX_URLS", "1000"))
+
+# Records are plain tuples in TestResult field order; keys not in the schema are dropped
+FIELDS = tuple(TestResult.model_fields)
+_URL = FIELDS.index("url")
+_PROTOCOL = FIELDS.index("protocol")
+_SUCCESS = FIELDS.index("success")
+_BATCH_ID = FIELDS.index("batch_id")
+
+
+class ResultStore:
+    """Thread-safe store of recent results.
+
+    Keeps a global ring of the last max_results results and a ring of the last
+    per_url results for each of up to max_urls URLs (least recently updated
+    URLs are evicted first). Both rings share the same record tuples, so
+    memory is bounded by max_results + per_url * max_urls records, at about
+    800 bytes each.
+
+    Every record gets an increasing sequence number, which doubles as the
+    pagination cursor.
+    """
+
+    def __init__(self, max_results=MAX_RESULTS, per_url=PER_URL_RESULTS, max_urls=MAX_URLS):
+        self.per_url = per_url
+        self.max_urls = max_urls
+        self._lock = Lock()
+        self._seq = 0
+        self._all = deque(maxlen=max_results)
+        self._by_url = OrderedDict()
+
+    def add(self, result: dict) -> int:
+        record = tuple(result.get(name) for name in FIELDS)
+        url = record[_URL]
+        with self._lock:
+            self._seq += 1
+            entry = (self._seq, record)
+            self._all.append(entry)
+            ring = self._by_url.get(url)
+            if ring is None:
+                ring = self._by_url[url] = deque(maxlen=self.per_url)
+                if len(self._by_url) > self.max_urls:
+                    self._by_url.popitem(last=False)
+            else:
+                self._by_url.move_to_end(url)
+            ring.append(entry)
+            return self._seq
+
+    def query(self, url=None, protocol=None, success=None, batch_id=None, cursor=None, limit=10):
+        """Return (results, next_cursor), newest first.
+
+        Pass next_cursor back as cursor to get the following page; it is None
+        when the page came back short.
+        """
+        results = []
+        next_cursor = None
+        with self._lock:
+            source = self._by_url.get(url, ()) if url is not None else self._all
+            for seq, record in reversed(source):
+                if cursor is not None and seq >= cursor:
+                    continue
+                if protocol is not None and record[_PROTOCOL] != protocol:
+                    continue
+                if success is not None and record[_SUCCESS] != success:
+                    continue
+                if batch_id is not None and record[_BATCH_ID] != batch_id:
+                    continue
+                results.append(record)
+                if len(results) == limit:
+                    next_cursor = seq
+                    break
+        return [dict(zip(FIELDS, record)) for record in results], next_cursor
+
+    def snapshot(self) -> dict:
+        """Copy of the store's contents for the snapshotter; records are shared, not copied."""
+        with self._lock:
+            return {
+                "fields": FIELDS,
+                "seq": self._seq,
+                "all": list(self._all),
+                "by_url": [(url, list(ring)) for url, ring in self._by_url.items()],
+            }
+
+    def restore(self, state: dict):
+        fields = state["fields"]
+        if fields != FIELDS:
+            # The schema changed since the snapshot; map records onto the new field order
+            def convert(entry):
+                old = dict(zip(fields, entry[1]))
+                return entry[0], tuple(old.get(name) for name in FIELDS)
+        else:
+            def convert(entry):
+                return entry
+        converted = {}
+        with self._lock:
+            self._seq = state["seq"]
+            self._all.clear()
+            self._all.extend(converted.setdefault(e[0], convert(e)) for e in state["all"])
+            self._by_url.clear()
+            for url, entries in state["by_url"][-self.max_urls:]:
+                ring = self._by_url[url] = deque(maxlen=self.per_url)
+                ring.extend(converted.setdefault(e[0], convert(e)) for e in entries)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._all)
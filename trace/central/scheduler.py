@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import heapq
+import uuid
+import asyncio
+import hashlib
+import threading
+import itertools
+
+TARGETS_FILE = os.environ.get("SCHEDULER_TARGETS_FILE", "scheduler_targets.json")
+# What to do with runs missed while central was down:
+#   "skip" - resume at the next regular slot
+#   "once" - fire one catch-up run immediately, then resume
+#   "all"  - fire every missed run (capped at MAX_CATCHUP_RUNS)
+CATCHUP_POLICY = os.environ.get("SCHEDULER_CATCHUP_POLICY", "once")
+MAX_CATCHUP_RUNS = 100
+# Longest the loop sleeps, so newly added targets are picked up promptly
+MAX_SLEEP = 1.0
+SAVE_INTERVAL = 30
+# Most runs handed to the job queue per submission
+SUBMIT_CHUNK = 5000
+MIN_INTERVAL = 1
+
+
+def phase(target_id: str, interval: float) -> float:
+    """Deterministic offset within the interval, so targets don't all fire together."""
+    digest = hashlib.blake2b(target_id.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64 * interval
+
+
+def next_slot(target, after: float) -> float:
+    """First scheduled time strictly after `after` for the target."""
+    interval = target["interval"]
+    offset = phase(target["id"], interval)
+    return (((after - offset) // interval) + 1) * interval + offset
+
+
+class Scheduler:
+    """Emits jobs for recurring targets to http_test_requests.
+
+    Targets sit in a min-heap keyed by their next run time, so each tick only
+    touches targets that are due. Every target fires at a fixed phase within
+    its interval derived from its id. Targets and their last run times are
+    persisted to TARGETS_FILE, which is local to the one central replica
+    that runs the scheduler.
+    """
+
+    def __init__(self, job_queue, path=TARGETS_FILE, catchup=CATCHUP_POLICY):
+        self.job_queue = job_queue
+        self.path = path
+        self.catchup = catchup
+        self.targets = {}
+        self._heap = []  # (run_at, version, target_id)
+        self._versions = {}
+        self._counter = itertools.count()
+        self._dirty = False
+        self._write_lock = threading.Lock()
+        self._task = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            saved = json.load(f)
+        now = time.time()
+        for target in saved:
+            self.targets[target["id"]] = target
+            self._schedule(target, self._first_run(target, now))
+        print(f"Loaded {len(saved)} scheduled targets")
+
+    def save(self):
+        self._write(self._snapshot())
+
+    async def save_in_background(self):
+        # Serializing every target takes long enough at scale to stall the
+        # API, so only the copy happens on the event loop
+        snapshot = self._snapshot()
+        try:
+            await asyncio.to_thread(self._write, snapshot)
+        except Exception:
+            self._dirty = True
+            raise
+
+    def _snapshot(self):
+        # The list is copied so add/remove can't change it mid-write. The
+        # targets themselves are shared: run() only ever replaces the value
+        # of last_run, which never resizes the dict being serialized
+        snapshot = list(self.targets.values())
+        self._dirty = False
+        return snapshot
+
+    def _write(self, targets):
+        # A background write can still be running when stop() saves
+        with self._write_lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(targets, f)
+            os.replace(tmp, self.path)
+
+    def _first_run(self, target, now):
+        last_run = target.get("last_run")
+        if last_run is None or self.catchup == "skip":
+            return next_slot(target, now)
+        missed = next_slot(target, last_run)
+        if missed > now:
+            return missed
+        if self.catchup == "all":
+            # run() keeps firing through the backlog from here
+            return max(missed, next_slot(target, now - MAX_CATCHUP_RUNS * target["interval"]))
+        return now
+
+    def _schedule(self, target, run_at):
+        version = next(self._counter)
+        self._versions[target["id"]] = version
+        heapq.heappush(self._heap, (run_at, version, target["id"]))
+
+    def add(self, job: dict, interval: float, target_id: str | None = None) -> dict:
+        target = {
+            "id": target_id or uuid.uuid4().hex,
+            "interval": max(float(interval), MIN_INTERVAL),
+            "job": job,
+            "last_run": None,
+        }
+        self.targets[target["id"]] = target
+        self._schedule(target, next_slot(target, time.time()))
+        self._dirty = True
+        return target
+
+    def remove(self, target_id: str) -> bool:
+        # The heap entry is left behind and skipped when popped
+        self._versions.pop(target_id, None)
+        self._dirty = True
+        return self.targets.pop(target_id, None) is not None
+
+    def start(self):
+        self.load()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        if self._dirty:
+            self.save()
+
+    async def run(self):
+        last_save = time.monotonic()
+        while True:
+            now = time.time()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                run_at, version, target_id = heapq.heappop(self._heap)
+                if self._versions.get(target_id) != version:
+                    continue
+                target = self.targets[target_id]
+                due.append(dict(target["job"], scheduled_at=run_at, target_id=target_id))
+                target["last_run"] = run_at
+                following = next_slot(target, run_at)
+                if following <= now and self.catchup != "all":
+                    following = next_slot(target, now)
+                self._schedule(target, following)
+
+            if due:
+                self._dirty = True
+                # A catch-up after a restart can make every target due at
+                # once, more than the queue ever accepts in one submission
+                chunk = min(SUBMIT_CHUNK, self.job_queue.max_pending)
+                for i in range(0, len(due), chunk):
+                    jobs = due[i:i + chunk]
+                    if not self.job_queue.submit(jobs):
+                        # Wait for room like a batch submission would before giving up
+                        if not await self.job_queue.put(jobs, timeout=60):
+                            print(f"Scheduler dropped {len(jobs)} runs: probe queue is full")
+
+            if self._dirty and time.monotonic() - last_save > SAVE_INTERVAL:
+                try:
+                    await self.save_in_background()
+                except Exception as e:
+                    print("Error saving scheduled targets:", e)
+                last_save = time.monotonic()
+
+            sleep = MAX_SLEEP
+            if self._heap:
+                sleep = min(max(self._heap[0][0] - time.time(), 0), MAX_SLEEP)
+            await asyncio.sleep(sleep)
@@ -0,0 +1,84 @@
+import os
+import time
+import pickle
+from threading import Thread
+
+SNAPSHOT_FILE = os.environ.get("CENTRAL_SNAPSHOT_FILE", "central_snapshot.pickle")
+# Seconds between snapshots; 0 disables them
+SNAPSHOT_INTERVAL = float(os.environ.get("CENTRAL_SNAPSHOT_INTERVAL", "60"))
+# Bump when the snapshot layout changes; older snapshots are then ignored
+SNAPSHOT_VERSION = 1
+
+
+class Snapshotter:
+    """Periodic snapshots of central's in-memory stores plus the consumer
+    offsets they cover.
+
+    stores maps a name to an object with snapshot() and restore(state).
+    maybe_save() must be called from the thread that feeds the stores, between
+    polls, so the state and the offsets line up exactly. Copying the stores
+    happens there; pickling and writing the file happen on a background thread.
+
+    Restoring and then consuming from the saved offsets means a restart only
+    replays what arrived after the last snapshot instead of the whole topic.
+    """
+
+    def __init__(self, stores: dict, path=SNAPSHOT_FILE, interval=SNAPSHOT_INTERVAL):
+        self.stores = stores
+        self.path = path
+        self.interval = interval
+        self._last = time.monotonic()
+        self._writer = None
+
+    def load(self):
+        """Restore the stores from the snapshot file; returns {partition: offset}, or None."""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                saved = pickle.load(f)
+        except Exception as e:
+            print("Ignoring unreadable snapshot:", e)
+            return None
+        if saved.get("version") != SNAPSHOT_VERSION:
+            print("Ignoring snapshot with unknown version", saved.get("version"))
+            return None
+        for name, store in self.stores.items():
+            if name in saved["stores"]:
+                store.restore(saved["stores"][name])
+        print(f"Restored snapshot from {time.ctime(saved['time'])}, offsets {saved['offsets']}")
+        return saved["offsets"]
+
+    def _capture(self, consumer):
+        return {
+            "version": SNAPSHOT_VERSION,
+            "time": time.time(),
+            "offsets": {tp.partition: consumer.position(tp) for tp in consumer.assignment()},
+            "stores": {name: store.snapshot() for name, store in self.stores.items()},
+        }
+
+    def _write(self, state):
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print("Error writing snapshot:", e)
+
+    def maybe_save(self, consumer):
+        if self.interval <= 0 or time.monotonic() - self._last < self.interval:
+            return
+        if self._writer is not None and self._writer.is_alive():
+            return  # previous snapshot still being written
+        self._last = time.monotonic()
+        self._writer = Thread(target=self._write, args=(self._capture(consumer),), daemon=True)
+        self._writer.start()
+
+    def save(self, consumer):
+        """Write a snapshot now and wait for it, e.g. on shutdown."""
+        if self.interval <= 0:
+            return
+        if self._writer is not None:
+            self._writer.join()
+        self._write(self._capture(consumer))
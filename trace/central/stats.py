@@ -0,0 +1,184 @@
+import os
+import math
+from threading import Lock
+from collections import OrderedDict
+
+# Relative accuracy of the latency sketch: reported percentiles are within 1%
+SKETCH_ACCURACY = 0.01
+_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+MIN_LATENCY_MS = 0.01
+
+# Window name -> (span in seconds, number of slots). Each window is a ring of
+# slots, so it slides in steps of span / slots.
+WINDOWS = {
+    "1m": (60, 6),
+    "15m": (900, 15),
+    "1h": (3600, 12),
+    "24h": (86400, 24),
+}
+PERCENTILES = (50, 95, 99)
+MAX_URLS = int(os.environ.get("STATS_MAX_URLS", "10000"))
+
+
+def _bucket(value_ms):
+    return math.ceil(math.log(max(value_ms, MIN_LATENCY_MS)) / _LOG_GAMMA)
+
+
+def _quantile(sketch, total, q):
+    # Walk buckets in order until q of the samples are covered; the bucket's
+    # midpoint is within SKETCH_ACCURACY of every value that landed in it
+    rank = q * (total - 1)
+    seen = 0
+    for index in sorted(sketch):
+        seen += sketch[index]
+        if seen > rank:
+            return 2 * _GAMMA ** index / (_GAMMA + 1)
+    return None
+
+
+class _Slot:
+    __slots__ = ("epoch", "success", "failure", "sketch")
+
+    def __init__(self):
+        self.epoch = -1
+        self.success = 0
+        self.failure = 0
+        self.sketch = {}
+
+
+class _Window:
+    __slots__ = ("width", "slots")
+
+    def __init__(self, span, n):
+        self.width = span / n
+        self.slots = [_Slot() for _ in range(n)]
+
+    def add(self, t, success, bucket):
+        epoch = int(t // self.width)
+        slot = self.slots[epoch % len(self.slots)]
+        if epoch < slot.epoch:
+            return  # older than the window already covers
+        if slot.epoch != epoch:
+            slot.epoch = epoch
+            slot.success = slot.failure = 0
+            slot.sketch = {}
+        if success:
+            slot.success += 1
+            slot.sketch[bucket] = slot.sketch.get(bucket, 0) + 1
+        else:
+            slot.failure += 1
+
+    def snapshot(self):
+        return [(s.epoch, s.success, s.failure, dict(s.sketch)) for s in self.slots]
+
+    def restore(self, slots):
+        if len(slots) != len(self.slots):
+            return  # window was resized; start it empty
+        for slot, (epoch, success, failure, sketch) in zip(self.slots, slots):
+            slot.epoch = epoch
+            slot.success = success
+            slot.failure = failure
+            slot.sketch = sketch
+
+    def merged(self, now):
+        oldest = int(now // self.width) - len(self.slots)
+        success = failure = 0
+        sketch = {}
+        for slot in self.slots:
+            if slot.epoch > oldest:
+                success += slot.success
+                failure += slot.failure
+                for index, count in slot.sketch.items():
+                    sketch[index] = sketch.get(index, 0) + count
+        return success, failure, sketch
+
+
+class UrlStats:
+    __slots__ = ("windows",)
+
+    def __init__(self):
+        self.windows = {name: _Window(span, n) for name, (span, n) in WINDOWS.items()}
+
+    def add(self, t, success, bucket):
+        for window in self.windows.values():
+            window.add(t, success, bucket)
+
+    def snapshot(self):
+        return {name: window.snapshot() for name, window in self.windows.items()}
+
+    def restore(self, state):
+        for name, slots in state.items():
+            if name in self.windows:
+                self.windows[name].restore(slots)
+
+    def summary(self, now):
+        out = {}
+        for name, window in self.windows.items():
+            success, failure, sketch = window.merged(now)
+            total = success + failure
+            entry = {
+                "count": total,
+                "success": success,
+                "failure": failure,
+                "availability": success / total if total else None,
+            }
+            for p in PERCENTILES:
+                entry[f"p{p}"] = _quantile(sketch, success, p / 100) if success else None
+            out[name] = entry
+        return out
+
+
+class StatsStore:
+    """Sliding-window availability and latency percentiles per URL.
+
+    Each result updates a fixed number of slots (one per window per URL, plus
+    the all-URL totals), so add() is O(1). Latency is kept in log-bucketed
+    sketches that merge by adding counts, so no raw samples are stored.
+    Latency covers successful results only; failures count against
+    availability.
+    """
+
+    def __init__(self, max_urls=MAX_URLS):
+        self.max_urls = max_urls
+        self._lock = Lock()
+        self._total = UrlStats()
+        self._by_url = OrderedDict()
+
+    def add(self, result: dict):
+        url = result.get("url")
+        t = result.get("timestamp")
+        success = bool(result.get("success"))
+        bucket = _bucket(result.get("elapsed_ms") or 0.0)
+        with self._lock:
+            stats = self._by_url.get(url)
+            if stats is None:
+                stats = self._by_url[url] = UrlStats()
+                if len(self._by_url) > self.max_urls:
+                    self._by_url.popitem(last=False)
+            else:
+                self._by_url.move_to_end(url)
+            stats.add(t, success, bucket)
+            self._total.add(t, success, bucket)
+
+    def summary(self, now, url=None):
+        """Per-window stats for url, or across all URLs when url is None."""
+        with self._lock:
+            stats = self._total if url is None else self._by_url.get(url)
+            return stats.summary(now) if stats else None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "total": self._total.snapshot(),
+                "by_url": [(url, stats.snapshot()) for url, stats in self._by_url.items()],
+            }
+
+    def restore(self, state: dict):
+        with self._lock:
+            self._total = UrlStats()
+            self._total.restore(state["total"])
+            self._by_url.clear()
+            for url, saved in state["by_url"][-self.max_urls:]:
+                stats = self._by_url[url] = UrlStats()
+                stats.restore(saved)
@@ -0,0 +1,116 @@
+import os
+import json
+import asyncio
+from collections import deque
+
+# Results are coalesced and pushed to subscribers every FLUSH_MS
+FLUSH_MS = int(os.environ.get("STREAM_FLUSH_MS", "250"))
+# Results waiting for the next flush; older ones are dropped past this
+MAX_PENDING_RESULTS = 10000
+# Flushes a subscriber may have queued before the slow-client policy applies
+MAX_SUBSCRIBER_BACKLOG = int(os.environ.get("STREAM_MAX_BACKLOG", "40"))
+# "drop" discards the subscriber's oldest queued flushes, "disconnect" closes it
+SLOW_CLIENT_POLICY = os.environ.get("STREAM_SLOW_CLIENT_POLICY", "drop")
+HEARTBEAT_SECONDS = 15
+
+
+class Subscriber:
+    __slots__ = ("url", "protocol", "backlog", "wakeup", "dropped", "closed")
+
+    def __init__(self, url, protocol):
+        self.url = url
+        self.protocol = protocol
+        self.backlog = deque()
+        self.wakeup = asyncio.Event()
+        self.dropped = 0
+        self.closed = False
+
+
+class ResultBroadcaster:
+    """Fans new results out to streaming subscribers as server-sent events.
+
+    The listener thread only appends to a deque; a task on the event loop
+    drains it every FLUSH_MS, serializes each result once and sends every
+    subscriber with the same filter the same joined bytes.
+    """
+
+    def __init__(self, flush_ms=FLUSH_MS):
+        self.flush_interval = flush_ms / 1000
+        self._pending = deque(maxlen=MAX_PENDING_RESULTS)
+        self._subscribers = set()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+        for sub in self._subscribers:
+            sub.closed = True
+            sub.wakeup.set()
+
+    def publish(self, result: dict):
+        # Called from the listener thread; deque.append is thread-safe
+        if self._subscribers:
+            self._pending.append(result)
+
+    def subscribe(self, url=None, protocol=None) -> Subscriber:
+        sub = Subscriber(url, protocol)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self._subscribers.discard(sub)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._pending:
+                self._flush()
+
+    def _flush(self):
+        frames = []
+        while self._pending:
+            result = self._pending.popleft()
+            frame = b"data: " + json.dumps(result).encode() + b"\n\n"
+            frames.append((result.get("url"), result.get("protocol"), frame))
+
+        payloads = {}
+        for sub in list(self._subscribers):
+            key = (sub.url, sub.protocol)
+            payload = payloads.get(key)
+            if payload is None:
+                payload = payloads[key] = b"".join(
+                    frame for url, protocol, frame in frames
+                    if (sub.url is None or url == sub.url) and (sub.protocol is None or protocol == sub.protocol)
+                )
+            if not payload:
+                continue
+            if len(sub.backlog) >= MAX_SUBSCRIBER_BACKLOG:
+                if SLOW_CLIENT_POLICY == "disconnect":
+                    sub.closed = True
+                    self._subscribers.discard(sub)
+                    sub.wakeup.set()
+                    continue
+                sub.backlog.popleft()
+                sub.dropped += 1
+            sub.backlog.append(payload)
+            sub.wakeup.set()
+
+    async def events(self, sub: Subscriber):
+        """Yield SSE chunks for sub until it is closed."""
+        yield b": connected\n\n"
+        while not sub.closed:
+            try:
+                await asyncio.wait_for(sub.wakeup.wait(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+            sub.wakeup.clear()
+            if sub.dropped:
+                # Tell the client it missed some flushes
+                yield f"event: dropped\ndata: {sub.dropped}\n\n".encode()
+                sub.dropped = 0
+            while sub.backlog:
+                yield sub.backlog.popleft()
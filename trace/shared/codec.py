@@ -0,0 +1,63 @@
+import os
+import json
+
+try:
+    import msgpack
+except ImportError:  # fall back to plain JSON on the wire
+    msgpack = None
+
+# Wire format: one version byte, then the payload.
+#   0x01 - msgpack map, known keys replaced by the integer ids below
+# Messages that start with "{" are legacy JSON and are always accepted.
+VERSION_MSGPACK = 1
+# What producers write: "msgpack", or "json" while old consumers are still
+# running. Consumers read both either way.
+WIRE_FORMAT = os.environ.get("TRACE_WIRE_FORMAT", "msgpack")
+
+# Field ids are part of the wire format: only ever append to this list, never
+# reorder or reuse an id. Keys not listed here are sent as strings.
+FIELD_NAMES = (
+    # jobs
+    "url", "method", "type", "read_body", "max_body_bytes", "bypass_dns_cache",
+    "rate_limit", "rate_burst", "batch_id",
+    # results
+    "status_code", "elapsed_ms", "success", "error", "timestamp",
+    "dns_ok", "tcp_ok", "ssl_ok", "send_ok", "recv_ok", "protocol", "ssl_cert_error",
+    "connection_reused", "http_version", "dns_ms", "connect_ms", "tls_ms", "ttfb_ms",
+    "total_ms", "body_ms", "body_bytes", "body_truncated", "tls_resumed",
+    # pipeline timestamps
+    "enqueued_at", "picked_at", "started_at", "finished_at", "ingested_at",
+    "error_kind",
+    # jobs, added later
+    "http2",
+)
+FIELD_IDS = {name: i for i, name in enumerate(FIELD_NAMES)}
+
+_PREFIX = bytes([VERSION_MSGPACK])
+
+
+def _field_name(key):
+    if isinstance(key, int):
+        # An id from a newer producer that this build doesn't know yet
+        return FIELD_NAMES[key] if key < len(FIELD_NAMES) else f"field_{key}"
+    return key
+
+
+def encode(value) -> bytes:
+    if msgpack is None or WIRE_FORMAT == "json" or not isinstance(value, dict):
+        return json.dumps(value).encode("utf-8")
+    compact = {FIELD_IDS.get(k, k): v for k, v in value.items()}
+    return _PREFIX + msgpack.packb(compact, use_bin_type=True)
+
+
+def decode(data: bytes):
+    if not data:
+        return None
+    version = data[0]
+    if version == VERSION_MSGPACK:
+        if msgpack is None:
+            raise ValueError("Message is msgpack-encoded but msgpack is not installed")
+        compact = msgpack.unpackb(memoryview(data)[1:], raw=False, strict_map_key=False)
+        return {_field_name(k): v for k, v in compact.items()}
+    # Anything else is JSON from before the codec (or from a producer without msgpack)
+    return json.loads(data.decode("utf-8"))
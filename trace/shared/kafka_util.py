@@ -1,20 +1,66 @@
-from kafka import KafkaProducer, KafkaConsumer
-import json
+from kafka import KafkaProducer, KafkaConsumer, ConsumerRebalanceListener, OffsetAndMetadata, TopicPartition
+from shared import codec
+import os
 
-KAFKA_BROKER = "localhost:9092"
+KAFKA_BROKER = os.environ.get("KAFKA_BROKER", "localhost:9092")
+# Batch compression for every producer: lz4 (default), gzip or none. lz4 is in
+# requirements.txt; snappy and zstd would need packages that are not.
+KAFKA_COMPRESSION = os.environ.get("KAFKA_COMPRESSION") or "lz4"
 
-def get_producer():
+def get_producer(**config):
+    compression = config.get("compression_type") or KAFKA_COMPRESSION
+    config["compression_type"] = None if compression == "none" else compression
     return KafkaProducer(
         bootstrap_servers=KAFKA_BROKER,
-        value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+        value_serializer=codec.encode,
+        key_serializer=lambda k: k.encode("utf-8") if k is not None else None,
+        **config,
     )
 
-def get_consumer(topic, group_id):
-    return KafkaConsumer(
-        topic,
+class _SeekOnAssign(ConsumerRebalanceListener):
+    # Seeks each partition to its saved offset the first time it is assigned,
+    # before anything is fetched. Later rebalances resume from the group's
+    # committed offsets instead of rewinding to the startup snapshot.
+    def __init__(self, consumer, start_offsets):
+        self.consumer = consumer
+        self.start_offsets = dict(start_offsets)
+
+    def on_partitions_assigned(self, assigned):
+        for tp in assigned:
+            offset = self.start_offsets.pop(tp.partition, None)
+            if offset is not None:
+                self.consumer.seek(tp, offset)
+
+    def on_partitions_revoked(self, revoked):
+        pass
+
+def get_consumer(topic, group_id, start_offsets=None, **config):
+    config.setdefault("auto_offset_reset", "earliest")
+    config.setdefault("enable_auto_commit", True)
+    consumer = KafkaConsumer(
         bootstrap_servers=KAFKA_BROKER,
         group_id=group_id,
-        auto_offset_reset="earliest",
-        value_deserializer=lambda x: json.loads(x.decode("utf-8")),
-        enable_auto_commit=True
+        value_deserializer=codec.decode,
+        **config,
     )
+    listener = _SeekOnAssign(consumer, start_offsets) if start_offsets else None
+    consumer.subscribe([topic], listener=listener)
+    return consumer
+
+def lookback_offsets(topic, count):
+    # A throwaway consumer outside any group, so nothing is committed or rebalanced
+    consumer = KafkaConsumer(bootstrap_servers=KAFKA_BROKER)
+    try:
+        partitions = consumer.partitions_for_topic(topic) or ()
+        tps = [TopicPartition(topic, p) for p in partitions]
+        if not tps:
+            return {}
+        beginning = consumer.beginning_offsets(tps)
+        end = consumer.end_offsets(tps)
+        return {tp.partition: max(end[tp] - count, beginning[tp]) for tp in tps}
+    finally:
+        consumer.close()
+
+def commit(consumer, offsets):
+    # offsets maps TopicPartition to the next offset to consume
+    consumer.commit({tp: OffsetAndMetadata(offset, "", -1) for tp, offset in offsets.items()})
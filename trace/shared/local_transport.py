@@ -0,0 +1,308 @@
+import os
+import time
+import struct
+import threading
+from collections import deque, namedtuple
+from shared.codec import encode as _encode, decode as _decode
+
+# Field names match kafka-python's TopicPartition and ConsumerRecord, so the
+# worker and central can use either transport unchanged. Local topics have a
+# single partition, 0.
+TopicPartition = namedtuple("TopicPartition", "topic partition")
+Message = namedtuple("Message", "topic partition offset key value")
+
+_HEADER = struct.Struct(">II")  # key length, value length
+_POLL_SLEEP = 0.01
+# Bytes read from a topic file per poll (more if a single record is larger)
+_READ_CHUNK = 1024 * 1024
+
+
+class _LocalConsumer:
+    """Shared consumer logic: positions, committed offsets, poll and iteration."""
+
+    def __init__(self, topic, group_id, enable_auto_commit=True, auto_offset_reset="earliest",
+                 start_offsets=None, **_):
+        self.topic = topic
+        self.group_id = group_id
+        self.tp = TopicPartition(topic, 0)
+        self.auto_commit = enable_auto_commit
+        committed = self._load_committed()
+        if start_offsets and 0 in start_offsets:
+            self._position = start_offsets[0]
+        elif committed is not None:
+            self._position = committed
+        elif auto_offset_reset == "latest":
+            self._position = self._end_offset()
+        else:
+            self._position = 0
+        self._closed = False
+        self._paused = False
+
+    def assignment(self):
+        return {self.tp}
+
+    def position(self, tp):
+        return self._position
+
+    def highwater(self, tp):
+        return self._end_offset()
+
+    def seek(self, tp, offset):
+        self._position = offset
+
+    def pause(self, *partitions):
+        if self.tp in partitions:
+            self._paused = True
+
+    def resume(self, *partitions):
+        if self.tp in partitions:
+            self._paused = False
+
+    def paused(self):
+        return {self.tp} if self._paused else set()
+
+    def poll(self, timeout_ms=0, max_records=500):
+        deadline = time.monotonic() + timeout_ms / 1000
+        if self._paused:
+            # Like Kafka, a paused consumer still waits out the timeout
+            time.sleep(max(deadline - time.monotonic(), 0))
+            return {}
+        while True:
+            records = self._read(self._position, max_records)
+            if records:
+                self._position = records[-1].offset + self._record_size(records[-1])
+                if self.auto_commit:
+                    self.commit()
+                return {self.tp: records}
+            if self._closed or not self._wait(deadline):
+                return {}
+
+    def __iter__(self):
+        while not self._closed:
+            for records in self.poll(timeout_ms=1000).values():
+                yield from records
+
+    def commit(self, offsets=None):
+        # offsets maps TopicPartition to an OffsetAndMetadata-like value or an int
+        if offsets:
+            offset = getattr(offsets[self.tp], "offset", offsets[self.tp])
+        else:
+            offset = self._position
+        self._store_committed(offset)
+
+    def close(self, autocommit=True):
+        if autocommit and self.auto_commit:
+            self.commit()
+        self._closed = True
+
+
+class _MemoryLog:
+    def __init__(self):
+        self.records = []  # (key, value bytes)
+        self.committed = {}  # group_id -> offset
+        self.cond = threading.Condition()
+
+
+_memory_topics = {}
+_memory_lock = threading.Lock()
+
+
+def _memory_log(topic):
+    with _memory_lock:
+        log = _memory_topics.get(topic)
+        if log is None:
+            log = _memory_topics[topic] = _MemoryLog()
+        return log
+
+
+class MemoryProducer:
+    """In-process producer; messages are visible to MemoryConsumers in the same process."""
+
+    def __init__(self, **_):
+        pass
+
+    def send(self, topic, value=None, key=None):
+        log = _memory_log(topic)
+        with log.cond:
+            log.records.append((key, _encode(value)))
+            log.cond.notify_all()
+
+    def flush(self, timeout=None):
+        pass
+
+    def close(self, timeout=None):
+        pass
+
+
+class MemoryConsumer(_LocalConsumer):
+    """Consumer over an in-process topic. Offsets are list indexes."""
+
+    def __init__(self, topic, group_id, **config):
+        self._log = _memory_log(topic)
+        super().__init__(topic, group_id, **config)
+
+    def _load_committed(self):
+        with self._log.cond:
+            return self._log.committed.get(self.group_id)
+
+    def _store_committed(self, offset):
+        with self._log.cond:
+            self._log.committed[self.group_id] = offset
+
+    def _end_offset(self):
+        with self._log.cond:
+            return len(self._log.records)
+
+    def _record_size(self, record):
+        return 1
+
+    def lookback(self, count):
+        return max(self._end_offset() - count, 0)
+
+    def _read(self, position, max_records):
+        with self._log.cond:
+            chunk = self._log.records[position:position + max_records]
+        return [
+            Message(self.topic, 0, position + i, key, _decode(value))
+            for i, (key, value) in enumerate(chunk)
+        ]
+
+    def _wait(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        with self._log.cond:
+            if self._position >= len(self._log.records):
+                self._log.cond.wait(remaining)
+        return True
+
+
+class FileProducer:
+    """Appends length-prefixed records to <dir>/<topic>.log.
+
+    Each record goes out in a single O_APPEND write, so several producer
+    processes can share a topic file.
+    """
+
+    def __init__(self, directory, **_):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._fds = {}
+        self._lock = threading.Lock()
+
+    def _fd(self, topic):
+        fd = self._fds.get(topic)
+        if fd is None:
+            path = os.path.join(self.directory, f"{topic}.log")
+            fd = self._fds[topic] = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        return fd
+
+    def send(self, topic, value=None, key=None):
+        key_bytes = key.encode("utf-8") if key is not None else b""
+        value_bytes = _encode(value)
+        record = _HEADER.pack(len(key_bytes), len(value_bytes)) + key_bytes + value_bytes
+        with self._lock:
+            os.write(self._fd(topic), record)
+
+    def flush(self, timeout=None):
+        with self._lock:
+            for fd in self._fds.values():
+                os.fsync(fd)
+
+    def close(self, timeout=None):
+        with self._lock:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds.clear()
+
+
+class FileConsumer(_LocalConsumer):
+    """Reads <dir>/<topic>.log. Offsets are byte positions in the file.
+
+    Committed offsets live in <dir>/<topic>.<group_id>.offset. Consumers in
+    one group do not split the topic between them, so run one per group.
+    """
+
+    def __init__(self, topic, group_id, directory, **config):
+        os.makedirs(directory, exist_ok=True)
+        self._path = os.path.join(directory, f"{topic}.log")
+        self._offset_path = os.path.join(directory, f"{topic}.{group_id}.offset")
+        self._file = None
+        super().__init__(topic, group_id, **config)
+
+    def _load_committed(self):
+        try:
+            with open(self._offset_path) as f:
+                return int(f.read())
+        except FileNotFoundError:
+            return None
+
+    def _store_committed(self, offset):
+        tmp = self._offset_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp, self._offset_path)
+
+    def _end_offset(self):
+        try:
+            return os.path.getsize(self._path)
+        except FileNotFoundError:
+            return 0
+
+    def _record_size(self, record):
+        return self._sizes[record.offset]
+
+    def lookback(self, count):
+        # Byte offsets can't be counted back from the end, so walk the headers
+        end = self._end_offset()
+        if count <= 0 or not end:
+            return end
+        starts = deque(maxlen=count)
+        position = 0
+        with open(self._path, "rb") as f:
+            while position + _HEADER.size <= end:
+                f.seek(position)
+                key_len, value_len = _HEADER.unpack(f.read(_HEADER.size))
+                starts.append(position)
+                position += _HEADER.size + key_len + value_len
+        return starts[0] if starts else end
+
+    def _read(self, position, max_records):
+        if self._file is None:
+            if not os.path.exists(self._path):
+                return []
+            self._file = open(self._path, "rb")
+        available = self._end_offset() - position
+        if available < _HEADER.size:
+            return []
+        self._file.seek(position)
+        data = self._file.read(min(available, _READ_CHUNK))
+        key_len, value_len = _HEADER.unpack_from(data, 0)
+        if _HEADER.size + key_len + value_len > len(data):
+            self._file.seek(position)
+            data = self._file.read(min(available, _HEADER.size + key_len + value_len))
+        records = []
+        self._sizes = {}
+        pos = 0
+        while len(records) < max_records and pos + _HEADER.size <= len(data):
+            key_len, value_len = _HEADER.unpack_from(data, pos)
+            end = pos + _HEADER.size + key_len + value_len
+            if end > len(data):
+                break  # record still being written
+            key = data[pos + _HEADER.size:pos + _HEADER.size + key_len].decode("utf-8") or None
+            value = _decode(data[end - value_len:end])
+            records.append(Message(self.topic, 0, position + pos, key, value))
+            self._sizes[position + pos] = end - pos
+            pos = end
+        return records
+
+    def _wait(self, deadline):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(_POLL_SLEEP)
+        return True
+
+    def close(self, autocommit=True):
+        super().close(autocommit)
+        if self._file:
+            self._file.close()
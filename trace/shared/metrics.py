@@ -0,0 +1,202 @@
+import os
+import bisect
+import resource
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds, as Prometheus expects
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels.
+
+    inc() is a dict update with no lock; the worker's hot path runs on a
+    single event loop thread, so there is nothing to race with. fn, if
+    given, is called at scrape time and returns {label values: value}, for
+    counts another object already keeps.
+    """
+
+    __slots__ = ("name", "help", "labelnames", "values", "fn")
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=(), fn=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # tuple of label values -> value
+        self.fn = fn
+
+    def inc(self, labels=(), amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def collect(self) -> dict:
+        return dict(self.fn()) if self.fn else dict(self.values)
+
+    def snapshot(self) -> dict:
+        return {"type": self.type, "help": self.help, "labelnames": self.labelnames, "values": self.collect()}
+
+    def merge(self, snapshot):
+        for labels, value in snapshot["values"].items():
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self, lines):
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+
+
+class Gauge(Counter):
+    """A value that goes up and down. Merged gauges are summed too, so only
+    use it for quantities that add up across processes (in-flight jobs,
+    memory, lag of partitions each owned by one process)."""
+
+    __slots__ = ()
+    type = "gauge"
+
+    def set(self, value, labels=()):
+        self.values[labels] = value
+
+    def set_all(self, values: dict):
+        self.values = dict(values)
+
+    def dec(self, labels=(), amount=1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class Histogram:
+    """Prometheus-style histogram.
+
+    observe() is a bisect and two increments with no lock: the worker calls
+    it from a single event loop thread and central from the listener thread,
+    and a scrape that races an update is at most one sample off.
+    """
+
+    __slots__ = ("name", "help", "buckets", "counts", "sum")
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        # Values computed across hosts can come out slightly negative from clock skew
+        value = max(value, 0.0)
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        return {"type": self.type, "help": self.help, "buckets": self.buckets,
+                "counts": list(self.counts), "sum": self.sum}
+
+    def merge(self, snapshot):
+        if tuple(snapshot["buckets"]) != self.buckets:
+            return
+        for i, count in enumerate(snapshot["counts"]):
+            self.counts[i] += count
+        self.sum += snapshot["sum"]
+
+    def render(self, lines):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {cumulative}")
+
+
+class Registry:
+    """A named set of metrics that renders in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _get(self, cls, name, *args, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, *args, **kwargs)
+        return metric
+
+    def counter(self, name, help, labelnames=(), fn=None) -> Counter:
+        return self._get(Counter, name, help, labelnames, fn)
+
+    def gauge(self, name, help, labelnames=(), fn=None) -> Gauge:
+        return self._get(Gauge, name, help, labelnames, fn)
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets)
+
+    def snapshot(self) -> dict:
+        """Picklable copy of every metric, e.g. to send to another process."""
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    @classmethod
+    def merged(cls, snapshots):
+        """A registry holding the sum of several snapshot() results."""
+        registry = cls()
+        for snapshot in snapshots:
+            for name, state in snapshot.items():
+                if state["type"] == "histogram":
+                    metric = registry.histogram(name, state["help"], state["buckets"])
+                elif state["type"] == "counter":
+                    metric = registry.counter(name, state["help"], state["labelnames"])
+                else:
+                    metric = registry.gauge(name, state["help"], state["labelnames"])
+                metric.merge(state)
+        return registry
+
+    def render(self) -> str:
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            metric.render(lines)
+        return "\n".join(lines) + "\n"
+
+
+def process_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak rather than current, but the best available off Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def start_http_server(port, render, host="0.0.0.0"):
+    """Serve render() at /metrics from a daemon thread; returns the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    return server
@@ -5,6 +5,17 @@ class TestRequest(BaseModel):
     url: HttpUrl
     method: str = "GET"
     type: str = "http"
+    read_body: bool = False
+    max_body_bytes: Optional[int] = None
+    bypass_dns_cache: bool = False
+    rate_limit: Optional[float] = None
+    rate_burst: Optional[int] = None
+    # None uses the worker's HTTP_ENABLE_HTTP2 setting
+    http2: Optional[bool] = None
+
+class ScheduledTarget(TestRequest):
+    interval: float
+    id: Optional[str] = None
 
 class TestResult(BaseModel):
     url: str
@@ -13,6 +24,9 @@ class TestResult(BaseModel):
     elapsed_ms: float
     success: bool
     error: str | None = None
+    # Coarse failure class for grouping: dns, connect, tls, send, receive,
+    # timeout, protocol, network, http_status, exception or other
+    error_kind: Optional[str] = None
     timestamp: float | None = None
     dns_ok: Optional[bool] = None
     tcp_ok: Optional[bool] = None
@@ -20,4 +34,23 @@ class TestResult(BaseModel):
     send_ok: Optional[bool] = None
     recv_ok: Optional[bool] = None
     protocol: Optional[str] = None
-    ssl_cert_error: Optional[str] = None
\ No newline at end of file
+    ssl_cert_error: Optional[str] = None
+    connection_reused: Optional[bool] = None
+    http_version: Optional[str] = None
+    dns_ms: Optional[float] = None
+    connect_ms: Optional[float] = None
+    tls_ms: Optional[float] = None
+    ttfb_ms: Optional[float] = None
+    total_ms: Optional[float] = None
+    body_ms: Optional[float] = None
+    body_bytes: Optional[int] = None
+    body_truncated: Optional[bool] = None
+    tls_resumed: Optional[bool] = None
+    batch_id: Optional[str] = None
+    # Pipeline timestamps (unix seconds): accepted by central, polled by the
+    # worker, probe start and end, and received back by central
+    enqueued_at: Optional[float] = None
+    picked_at: Optional[float] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    ingested_at: Optional[float] = None
\ No newline at end of file
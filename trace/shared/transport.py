@@ -0,0 +1,63 @@
+import os
+from urllib.parse import urlparse
+
+# Which backend carries jobs and results:
+#   "kafka"  - the Kafka cluster in kafka_util (default)
+#   "memory" - in-process topics, for running the whole pipeline in one process
+#   "file"   - append-only log files under TRACE_TRANSPORT_DIR
+TRANSPORT = os.environ.get("TRACE_TRANSPORT", "kafka")
+TRANSPORT_DIR = os.environ.get("TRACE_TRANSPORT_DIR", "transport_log")
+
+
+def job_host(job):
+    # Jobs are keyed by hostname, so Kafka's hash partitioner sends every job
+    # for a host to the same partition and therefore the same worker
+    return (urlparse(job.get("url") or "").hostname or "").lower()
+
+
+def get_producer(**config):
+    if TRANSPORT == "kafka":
+        from shared import kafka_util
+        return kafka_util.get_producer(**config)
+    if TRANSPORT == "memory":
+        from shared.local_transport import MemoryProducer
+        return MemoryProducer(**config)
+    if TRANSPORT == "file":
+        from shared.local_transport import FileProducer
+        return FileProducer(TRANSPORT_DIR, **config)
+    raise ValueError(f"Unknown transport: {TRANSPORT}")
+
+
+def get_consumer(topic, group_id, **config):
+    # start_offsets={partition: offset} starts those partitions there instead
+    # of at the group's committed offset
+    if TRANSPORT == "kafka":
+        from shared import kafka_util
+        return kafka_util.get_consumer(topic, group_id, **config)
+    if TRANSPORT == "memory":
+        from shared.local_transport import MemoryConsumer
+        return MemoryConsumer(topic, group_id, **config)
+    if TRANSPORT == "file":
+        from shared.local_transport import FileConsumer
+        return FileConsumer(topic, group_id, TRANSPORT_DIR, **config)
+    raise ValueError(f"Unknown transport: {TRANSPORT}")
+
+
+def lookback_offsets(topic, count):
+    """{partition: offset} starting count records before the end of each partition."""
+    if TRANSPORT == "kafka":
+        from shared import kafka_util
+        return kafka_util.lookback_offsets(topic, count)
+    consumer = get_consumer(topic, None, enable_auto_commit=False)
+    try:
+        return {0: consumer.lookback(count)}
+    finally:
+        consumer.close(autocommit=False)
+
+
+def commit(consumer, offsets):
+    """Commit {TopicPartition: next offset} for a consumer from get_consumer()."""
+    if TRANSPORT == "kafka":
+        from shared import kafka_util
+        return kafka_util.commit(consumer, offsets)
+    return consumer.commit(offsets)
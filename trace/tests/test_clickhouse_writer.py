@@ -0,0 +1,197 @@
+"""ClickHouseWriter against a local HTTP stand-in for ClickHouse.
+
+Run from the trace directory:
+
+    python -m pytest tests
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from central.clickhouse_util import ClickHouseClient, ClickHouseWriter
+
+
+class StandIn:
+    """Accepts every query like ClickHouse's HTTP interface would, or answers
+    with `status` while that is set. Records each INSERT's rows and time."""
+
+    def __init__(self):
+        self.status = None
+        self.fail_inserts = 0  # fail this many inserts with 500, then accept
+        self.inserts = []  # (time, rows) of accepted inserts
+        self.insert_attempts = []  # time of every insert attempt
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query).get("query", [""])[0]
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status = stand_in.handle(query, body)
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def handle(self, query, body):
+        with self.lock:
+            if self.status is not None:
+                return self.status
+            if not query.startswith("INSERT"):
+                return 200  # DDL
+            self.insert_attempts.append(time.monotonic())
+            if self.fail_inserts:
+                self.fail_inserts -= 1
+                return 500
+            self.inserts.append((time.monotonic(), body.splitlines()))
+            return 200
+
+    def rows(self):
+        with self.lock:
+            return [row for _, rows in self.inserts for row in rows]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def wait_for(condition, timeout=3):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def result(i):
+    return {"url": f"http://host{i}/", "method": "GET", "status_code": 200,
+            "elapsed_ms": 12.5, "success": True, "timestamp": 1700000000 + i}
+
+
+class ClickHouseWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = StandIn()
+        self.spill_dir = tempfile.mkdtemp()
+        self.writers = []
+
+    def tearDown(self):
+        for writer in self.writers:
+            writer.stop()
+        self.stand_in.close()
+        shutil.rmtree(self.spill_dir)
+
+    def writer(self, **kwargs):
+        kwargs.setdefault("flush_interval", 60)
+        kwargs.setdefault("backoff", 0.01)
+        writer = ClickHouseWriter(ClickHouseClient(self.stand_in.url), spill_dir=self.spill_dir, **kwargs)
+        self.writers.append(writer)
+        return writer
+
+    def spilled(self):
+        return sorted(f for f in os.listdir(self.spill_dir) if f.endswith(".ndjson"))
+
+    def test_flushes_when_buffer_reaches_flush_rows(self):
+        writer = self.writer(flush_rows=3)
+        writer.start()
+        writer.add(result(1))
+        writer.add(result(2))
+        time.sleep(0.2)
+        self.assertEqual(self.stand_in.rows(), [])
+        writer.add(result(3))
+        self.assertTrue(wait_for(lambda: len(self.stand_in.rows()) == 3))
+        self.assertEqual(len(self.stand_in.inserts), 1)
+        self.assertEqual(writer.rows_written, 3)
+
+    def test_flushes_after_flush_interval(self):
+        writer = self.writer(flush_rows=1000, flush_interval=0.2)
+        writer.start()
+        added = time.monotonic()
+        writer.add(result(1))
+        self.assertTrue(wait_for(lambda: self.stand_in.rows()))
+        self.assertGreaterEqual(self.stand_in.inserts[0][0] - added, 0.1)
+
+    def test_retries_with_exponential_backoff(self):
+        self.stand_in.fail_inserts = 2
+        writer = self.writer(retries=3, backoff=0.05)
+        writer.add(result(1))
+        writer.flush()
+        attempts = self.stand_in.insert_attempts
+        self.assertEqual(len(attempts), 3)
+        self.assertGreaterEqual(attempts[1] - attempts[0], 0.05)
+        self.assertGreaterEqual(attempts[2] - attempts[1], 0.1)
+        self.assertEqual(writer.rows_written, 1)
+        self.assertEqual(self.spilled(), [])
+
+    def test_spills_when_clickhouse_is_unavailable(self):
+        self.stand_in.status = 503
+        writer = self.writer(retries=2)
+        writer.add(result(1))
+        writer.add(result(2))
+        writer.flush()
+        self.assertEqual(len(self.spilled()), 1)
+        self.assertEqual(writer.rows_spilled, 2)
+        self.assertEqual(writer.rows_written, 0)
+
+    def test_replays_spilled_rows_after_recovery(self):
+        self.stand_in.status = 503
+        writer = self.writer(retries=2)
+        writer.add(result(1))
+        writer.flush()
+        self.assertEqual(len(self.spilled()), 1)
+
+        self.stand_in.status = None
+        writer.add(result(2))
+        writer.flush()
+        self.assertEqual(self.spilled(), [])
+        self.assertEqual(len(self.stand_in.rows()), 2)
+        self.assertEqual(writer.rows_written, 2)
+
+    def test_persisted_counts_inserted_and_spilled_rows_only(self):
+        writer = self.writer(retries=1)
+        writer.add(result(1))
+        writer.add(result(2))
+        self.assertEqual((writer.added, writer.persisted), (2, 0))
+        writer.flush()
+        self.assertEqual(writer.persisted, 2)
+
+        self.stand_in.status = 503
+        writer.add(result(3))
+        writer.flush()
+        self.assertEqual(writer.persisted, 3)
+
+        writer.spill_max_bytes = 0
+        writer.add(result(4))
+        writer.flush()
+        self.assertEqual(writer.persisted, 3)
+
+    def test_spill_directory_is_capped(self):
+        self.stand_in.status = 503
+        writer = self.writer(retries=1, spill_max_bytes=600)
+        for i in range(5):
+            writer.add(result(i))
+            writer.flush()
+        size = sum(os.path.getsize(os.path.join(self.spill_dir, f)) for f in self.spilled())
+        self.assertLessEqual(size, 600)
+        self.assertGreater(writer.rows_dropped, 0)
+        # The newest batch is kept, the oldest ones go
+        with open(os.path.join(self.spill_dir, self.spilled()[-1])) as f:
+            self.assertIn("host4", f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()